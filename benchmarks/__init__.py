@@ -0,0 +1,6 @@
+"""
+Benchmarks for airspeed velocity (asv).
+
+Run ``asv run`` in the repository root to track time and peak memory over commits,
+``asv continuous master HEAD`` to compare a change against master.
+"""
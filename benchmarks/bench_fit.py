@@ -0,0 +1,58 @@
+import numpy as np
+import uncertainties.unumpy as unp
+from smpl2 import fit
+from smpl2.functions import gauss
+
+def _skip_broken_fit():
+    """Skips (in asv) commits before fit.fit could run, where the eval-built model wrappers raised NameError."""
+    try:
+        fit.fit([0., 1., 2.], [1., 3., 5.], lambda x, a, b: a*x + b)
+    except NameError:
+        raise NotImplementedError
+
+class Auto:
+    """Model selection with ``fit.auto`` over ``fit.default_funcs``."""
+    params = [100, 1000]
+    param_names = ["size"]
+
+    def setup(self, size):
+        rng = np.random.default_rng(0)
+        self.x = np.linspace(-5, 5, size)
+        self.y = gauss(self.x, 0.5, 3, 1.2, 0.1) + rng.normal(0, 0.05, size)
+        self.uy = unp.uarray(self.y, 0.05)
+        _skip_broken_fit()
+
+    def time_auto(self, size):
+        fit.auto(self.x, self.y)
+
+    def time_auto_uncertain(self, size):
+        fit.auto(self.x, self.uy)
+
+    def peakmem_auto(self, size):
+        fit.auto(self.x, self.y)
+
+class Single:
+    """A single ``fit.fit`` of a gaussian."""
+
+    def setup(self):
+        _skip_broken_fit()
+        rng = np.random.default_rng(0)
+        self.x = np.linspace(-5, 5, 200)
+        self.y = gauss(self.x, 0.5, 3, 1.2, 0.1) + rng.normal(0, 0.05, 200)
+
+    def time_fit(self):
+        fit.fit(self.x, self.y, gauss, params=[0, 1, 1, 0])
+
+class Many:
+    """Batched ``fit.fit_many`` of gaussians sharing one x axis."""
+    params = [100, 1000]
+    param_names = ["datasets"]
+
+    def setup(self, datasets):
+        if not hasattr(fit, "fit_many"): raise NotImplementedError # added later
+        rng = np.random.default_rng(0)
+        self.x = np.linspace(-5, 5, 200)
+        self.y = gauss(self.x, 0.5, 3, 1.2, 0.1) + rng.normal(0, 0.05, (datasets, 200))
+
+    def time_fit_many(self, datasets):
+        fit.fit_many(self.x, self.y, gauss, params=[0, 1, 1, 0])
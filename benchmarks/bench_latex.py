@@ -0,0 +1,27 @@
+import tempfile
+import numpy as np
+import uncertainties.unumpy as unp
+from smpl2 import latex
+
+class Table:
+    """``latex.table`` of large arrays."""
+    params = [[100, 1000], [10, 50]]
+    param_names = ["rows", "columns"]
+
+    def setup(self, rows, columns):
+        self.tmp = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.data = rng.normal(size=(rows, columns))
+        self.udata = unp.uarray(self.data, np.abs(self.data) / 10)
+
+    def teardown(self, rows, columns):
+        self.tmp.cleanup()
+
+    def time_table(self, rows, columns):
+        latex.table(self.tmp.name, "table", self.data, unit="m")
+
+    def time_table_uncertain(self, rows, columns):
+        latex.table(self.tmp.name, "table", self.udata, unit="m")
+
+    def peakmem_table(self, rows, columns):
+        latex.table(self.tmp.name, "table", self.data, unit="m")
@@ -0,0 +1,29 @@
+from smpl2 import parallel
+from smpl2.probability import Discrete_Probability
+
+def _square(x):
+    return x * x
+
+class Par:
+    """``parallel.par`` over many small tasks."""
+    params = [10, 100]
+    param_names = ["tasks"]
+
+    def time_par(self, tasks):
+        parallel.par(_square, range(tasks))
+
+    def peakmem_par(self, tasks):
+        parallel.par(_square, range(tasks))
+
+class FloatOuter:
+    """Division of float supports with 1.5M outcome pairs by ``workers`` processes (0 is the serial path)."""
+    params = [0, 2, 4]
+    param_names = ["workers"]
+
+    def setup(self, workers):
+        self.a = Discrete_Probability({i / 7: 1 / 1500 for i in range(1500)})
+        self.b = Discrete_Probability({i / 3 + 1: 1 / 1000 for i in range(1000)})
+        self.a.workers = workers or None
+
+    def time_truediv(self, workers):
+        self.a / self.b
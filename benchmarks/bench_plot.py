@@ -0,0 +1,28 @@
+import os
+import tempfile
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+from smpl2 import plot
+
+class Save:
+    """``plot.save`` of a line plot in several formats."""
+    params = ["png", "pdf", "svg"]
+    param_names = ["format"]
+
+    def setup(self, format):
+        self.tmp = tempfile.TemporaryDirectory()
+        plt.figure()
+        x = np.linspace(0, 10, 10000)
+        plt.plot(x, np.sin(x))
+
+    def teardown(self, format):
+        plt.close("all")
+        self.tmp.cleanup()
+
+    def time_save(self, format):
+        plot.save(os.path.join(self.tmp.name, "plot"), format)
+
+    def peakmem_save(self, format):
+        plot.save(os.path.join(self.tmp.name, "plot"), format)
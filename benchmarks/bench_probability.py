@@ -0,0 +1,50 @@
+from smpl2.probability import Die, Dice_Keep_Sum, Discrete_Probability
+
+class DiceSum:
+    """Sums of ``n`` six-sided dice."""
+    params = [10, 100, 1000]
+    param_names = ["n"]
+
+    def setup(self, n):
+        self.die = Die(6)
+
+    def time_repeat_sum(self, n):
+        self.die.repeat_sum(n)
+
+    def time_chained_add(self, n):
+        result = self.die
+        for _ in range(n - 1):
+            result = result + self.die
+
+    def peakmem_repeat_sum(self, n):
+        self.die.repeat_sum(n)
+
+class KeepHighest:
+    """Sum of the highest ``k`` of ``n`` twenty-sided dice."""
+    params = [[4, 6, 10], [3, 5]]
+    param_names = ["n", "k"]
+
+    def setup(self, n, k):
+        if k >= n: raise NotImplementedError # asv skips invalid combinations
+
+    def time_keep_sum(self, n, k):
+        Dice_Keep_Sum(n, k, 20)
+
+    def peakmem_keep_sum(self, n, k):
+        Dice_Keep_Sum(n, k, 20)
+
+class FloatOperations:
+    """Binary operations and comparisons on float supports, which have no grid."""
+
+    def setup(self):
+        self.a = Discrete_Probability({i / 7: 1 / 300 for i in range(300)})
+        self.b = Discrete_Probability({i / 3 + 1: 1 / 200 for i in range(200)})
+
+    def time_truediv(self):
+        self.a / self.b
+
+    def time_compare(self):
+        self.a < self.b
+
+    def peakmem_truediv(self):
+        self.a / self.b
@@ -0,0 +1,46 @@
+import numpy as np
+import uncertainties.unumpy as unp
+from smpl2 import fit
+from smpl2.functions import gauss
+try:
+    from smpl2.uarray import Uncertain_Array, unv, usd
+except ImportError: # commits before smpl2.uarray, skipped in setup
+    Uncertain_Array = None
+
+class Propagate:
+    """Error propagation through a gaussian, ``unp.uarray`` against ``Uncertain_Array``."""
+    params = [1000, 100000]
+    param_names = ["size"]
+
+    def setup(self, size):
+        if Uncertain_Array is None: raise NotImplementedError
+        self.x = np.linspace(-5, 5, size)
+        self.ux = unp.uarray(self.x, 0.01)
+        self.ax = Uncertain_Array(self.x, 0.01)
+
+    def time_unumpy(self, size):
+        y = gauss(self.ux, 0.5, 3, 1.2, 0.1)
+        unp.nominal_values(y), unp.std_devs(y)
+
+    def time_uarray(self, size):
+        y = gauss(self.ax, 0.5, 3, 1.2, 0.1)
+        unv(y), usd(y)
+
+class Split:
+    """``fit.data_split`` of uncertain data, ``unp.uarray`` against ``Uncertain_Array``."""
+    params = [1000, 100000]
+    param_names = ["size"]
+
+    def setup(self, size):
+        if Uncertain_Array is None: raise NotImplementedError
+        rng = np.random.default_rng(0)
+        self.x = np.linspace(-5, 5, size)
+        y = gauss(self.x, 0.5, 3, 1.2, 0.1) + rng.normal(0, 0.05, size)
+        self.uy = unp.uarray(y, 0.05)
+        self.ay = Uncertain_Array(y, 0.05)
+
+    def time_unumpy(self, size):
+        fit.data_split(self.x, self.uy)
+
+    def time_uarray(self, size):
+        fit.data_split(self.x, self.ay)
@@ -3,5 +3,5 @@ Simplified data fitting.
 
 Uses scipy.optimize.curve_fit (no x errors) or scipy.odr (with x errors).
 """
-from .fit import auto, fit, data_split
-__all__ = ['auto', 'fit', 'data_split']
+from .fit import auto, fit, fit_many, bootstrap, data_split, Incremental_Fit, FitResult, collect
+__all__ = ['auto', 'fit', 'fit_many', 'bootstrap', 'data_split', 'Incremental_Fit', 'FitResult', 'collect']
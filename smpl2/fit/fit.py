@@ -1,45 +1,109 @@
+import contextlib
+import inspect
+import multiprocessing
+import signal
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from numpy.linalg import LinAlgError
 from scipy import optimize
+from scipy.linalg import solve_triangular
 from scipy.odr import Model, RealData, ODR
 import uncertainties as unc
-from uncertainties.unumpy import nominal_values as unv
-from uncertainties.unumpy import std_devs as usd
 # local imports
 from smpl2.functions import polN, order, cos, lorentz, gauss, split_gauss
 from smpl2.util import reduce_function, unv_lambda, uncertain
+from smpl2.uarray import unv, usd
+from smpl2.wrap import get_jacobian, is_linear
 
 default_funcs = [polN(3), order, cos, lorentz, gauss, split_gauss]
 
-def auto(datax, datay, *funcs, **kwargs):
+def auto(datax, datay, *funcs, workers=None, timeout=None, **kwargs):
     """
     Automatically loop over ``funcs`` and fit the best one.
     If no functions are given, use ``default_funcs``.
+
+    Candidates are fitted one after the other in this process, or concurrently by ``workers`` forked processes
+    where ``fork`` is available. Forking is opt-in, as it is unsafe in threaded hosts like Jupyter.
+    Each candidate gets ``timeout`` seconds (and ``maxfev`` evaluations) before it is dropped.
+    Every candidate is fitted completely, only its scoring stops early,
+    as soon as its partial sum of squares can no longer beat the best candidate scored so far.
     """
-    min_sq = None
     if len(funcs) == 0:
         funcs = default_funcs
-    for f in funcs:
-        if not callable(f): continue
-        try:
-            ff, fp = fit(datax, datay, f, **kwargs)
-            fy = ff(datax)
-        except (ValueError, LinAlgError):
-            continue
-        if uncertain(fy): # weighted residuals + favour small uncertainties
-            sum_sq = np.sum((fy - datay)**2 / (usd(datay)**2 + usd(fy)**2)) \
-                   + np.sum(usd(fy)**2 / usd(datay)**2)
-        else:
-            sum_sq = np.sum((fy - datay)**2)
-        if min_sq is None or sum_sq < min_sq:
+    funcs = [f for f in funcs if callable(f)]
+    workers = min(workers or 1, len(funcs))
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        state = funcs, datax, datay, timeout, multiprocessing.Value('d', np.inf), kwargs
+        _auto_init(*state)
+        results = [_auto_candidate(i) for i in range(len(funcs))]
+    else: # forked workers inherit the state, so lambdas like polN need no pickling
+        ctx = multiprocessing.get_context('fork')
+        state = funcs, datax, datay, timeout, ctx.Value('d', np.inf), kwargs
+        with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_auto_init, initargs=state) as pool:
+            results = list(pool.map(_auto_candidate, range(len(funcs))))
+
+    min_sq = None
+    for i, fp, sum_sq in results:
+        if sum_sq is not None and (min_sq is None or sum_sq < min_sq):
             min_sq = sum_sq
-            best = f, fp, ff
+            best = funcs[i], fp, _fitted(funcs[i], fp, kwargs.get('fixed_params', True), kwargs)
     return best
 
-def fit(datax, datay, function, params=None, fixed_params=True, **kwargs):
+_auto_state = None
+
+def _auto_init(*state):
+    global _auto_state
+    _auto_state = state
+
+def _auto_timeout(signum, frame):
+    raise TimeoutError
+
+def _auto_candidate(i):
+    """Fits and scores candidate ``i`` of :func:`auto`, returns ``(i, pfit, sum_sq)`` or ``(i, None, None)``."""
+    funcs, datax, datay, timeout, best, kwargs = _auto_state
+    timer = timeout is not None and hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+    if timer:
+        handler = signal.signal(signal.SIGALRM, _auto_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        ff, fp = result = fit(datax, datay, funcs[i], **kwargs)
+        if not result.success: return i, None, None
+        sum_sq = _auto_score(ff, datax, datay, best)
+    except (ValueError, LinAlgError, TimeoutError):
+        return i, None, None
+    finally:
+        if timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, handler)
+    return i, (fp if sum_sq is not None else None), sum_sq
+
+def _auto_score(ff, datax, datay, best, chunk=256):
+    """
+    Returns the sum of squares of ``ff`` (favouring small uncertainties), or None if it exceeds ``best.value``.
+    As all terms are positive, the sum is accumulated in chunks and dropped once it can no longer win.
+    """
+    sum_sq = 0.
+    for s in range(0, len(datax), chunk):
+        x, y = datax[s:s+chunk], datay[s:s+chunk]
+        fy = ff(x)
+        if uncertain(fy) and uncertain(y): # weighted residuals + favour small uncertainties
+            sum_sq += np.sum((unv(fy) - unv(y))**2 / (usd(y)**2 + usd(fy)**2)) \
+                    + np.sum(usd(fy)**2 / usd(y)**2)
+        else:
+            sum_sq += np.sum((unv(fy) - unv(y))**2)
+        if sum_sq >= best.value: return None
+    with best.get_lock():
+        best.value = min(best.value, sum_sq)
+    return sum_sq
+
+def fit(datax, datay, function, params=None, fixed_params=True, symbolic=None, **kwargs):
     """
     Returns a fit of ``function`` to ``datax`` and ``datay``.
-    Use ``_fit_odr`` or ``_fit_curvefit`` respectively if ``datay`` has or has not uncertainties.
+    Use ``_fit_odr`` or ``_fit_curvefit`` respectively if ``datax`` has or has not uncertainties.
+    Models linear in their (free) parameters are solved directly by ``_fit_linear`` if ``datax`` has no uncertainties.
 
     Parameters
     ==========
@@ -50,30 +114,551 @@ def fit(datax, datay, function, params=None, fixed_params=True, **kwargs):
     function : func
         Fit function with parameters: ``x``, ``*params``
     params : tuple, optional
-        starting fit parameters. None will let the fit method choose the parameters.
+        starting fit parameters. None will use the ``guess`` of ``function`` from the data if it has one
+        (see :mod:`smpl2.functions`), else let the fit method choose the parameters.
     fixed_params : bool, optional
         Whether to use fixed parameters in ``function``. The default is True.
+    symbolic : bool, optional
+        Whether to pass the analytic jacobian of ``function`` from sympy to the fit method.
+        The default None only does so for the functions in :mod:`smpl2.functions`.
     **kwargs : TYPE
         fixed parameters for ``function``, as well as for ``data_split`` and fit-method.
 
     Returns
     -------
-    ffit : f(x) -> y
-        optimized function.
-    pfit : tuple
-        optimized fit parameters.
+    result : FitResult
+        unpacks as ``(ffit, pfit)``: the optimized function and the optimized fit parameters,
+        with evaluation counts, timings and convergence diagnostics.
     """
+    model, times = function, {}
+    start = time.perf_counter()
     x, y, xerr, yerr = data_split(datax, datay, **kwargs)
+    times['data_split'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fixed = _fixed(function, fixed_params, kwargs)
+    jacobian = _jacobian(function, fixed, symbolic)
+    if params is None:
+        params = _guess(function, x, y, fixed)
+    free = [a for a in list(inspect.signature(function).parameters)[1:] if a not in fixed]
 
     if fixed_params:
-        function = reduce_function(function, **kwargs)
+        function = reduce_function(function, **fixed)
+        kwargs = {k: v for k, v in kwargs.items() if k not in fixed}
+    kwargs = {k: v for k, v in kwargs.items() if k not in ('range', 'selector', 'mode')} # used by data_split
+    # options like bounds need the optimizer, only absolute_sigma is supported by the closed form
+    linear = jacobian is not None and xerr is None and not set(kwargs) - {'absolute_sigma'} and is_linear(model, *free)
+    counts = {'nfev': 0, 'njev': 0}
+    f = _counted(unv_lambda(function), counts, 'nfev')
+    if jacobian is not None:
+        jacobian = tuple(_counted(j, counts, 'njev') for j in jacobian)
+    times['wrapper'] = time.perf_counter() - start
 
+    start = time.perf_counter()
     if xerr is not None:
-        pfit = _fit_odr(x, y, unv_lambda(function), params=params, xerr=xerr, yerr=yerr, **kwargs)
+        method = 'odr'
+        pfit, info = _fit_odr(x, y, f, params=params, xerr=xerr, yerr=yerr, jacobian=jacobian, **kwargs)
+    elif linear:
+        method = 'linear'
+        pfit, info = _fit_linear(x, y, f, jacobian[0], yerr=yerr, **kwargs)
+    else:
+        method = 'curve_fit'
+        pfit, info = _fit_curvefit(x, y, f, params=params, yerr=yerr, jacobian=jacobian, **kwargs)
+    times['optimizer'] = time.perf_counter() - start
+
+    result = FitResult(_fitted(function, pfit), pfit, model, method, ndf=len(x) - len(free), time=times, **counts, **info)
+    for results in _collectors:
+        results.append(result)
+    return result
+
+class FitResult(tuple):
+    """
+    Result of :func:`fit`, which unpacks as ``(ffit, pfit)`` and carries the diagnostics of the fit.
+
+    Attributes
+    ----------
+    function : func
+        the fitted model.
+    method : str
+        ``'curve_fit'``, ``'odr'`` or ``'linear'``.
+    nfev, njev : int
+        number of model and jacobian evaluations.
+    chi2, ndf : float, int
+        minimized (weighted) sum of squares and degrees of freedom, see ``chi2_ndf``.
+    success : bool
+        whether the optimizer converged.
+    message : str
+        message of the optimizer.
+    time : dict
+        wall time in seconds per phase ``'data_split'``, ``'wrapper'`` and ``'optimizer'``.
+    """
+    def __new__(cls, ffit, pfit, function, method, nfev=0, njev=0, chi2=np.nan, ndf=0, success=True, message='', time=None):
+        result = super().__new__(cls, (ffit, pfit))
+        result.function, result.method = function, method
+        result.nfev, result.njev = nfev, njev
+        result.chi2, result.ndf = chi2, ndf
+        result.success, result.message = success, message
+        result.time = time or {}
+        return result
+
+    @property
+    def ffit(self):
+        return self[0]
+
+    @property
+    def pfit(self):
+        return self[1]
+
+    @property
+    def chi2_ndf(self):
+        return self.chi2 / self.ndf if self.ndf > 0 else np.inf
+
+    def __repr__(self):
+        return "FitResult(%s, method=%s, success=%s, nfev=%i, njev=%i, chi2/ndf=%.4g, time=%.3gs)" % (
+            getattr(self.function, '__name__', self.function), self.method, self.success,
+            self.nfev, self.njev, self.chi2_ndf, sum(self.time.values()))
+
+    @staticmethod
+    def aggregate(results):
+        """
+        Returns totals per fitted function name over ``results``:
+        number of fits and failures, ``nfev``, ``njev`` and the wall time per phase.
+        """
+        stats = {}
+        for r in results:
+            s = stats.setdefault(getattr(r.function, '__name__', str(r.function)),
+                                 {'fits': 0, 'failures': 0, 'nfev': 0, 'njev': 0, 'time': {}})
+            s['fits'] += 1
+            s['failures'] += not r.success
+            s['nfev'] += r.nfev
+            s['njev'] += r.njev
+            for phase, t in r.time.items():
+                s['time'][phase] = s['time'].get(phase, 0.) + t
+        return stats
+
+_collectors = []
+
+@contextlib.contextmanager
+def collect():
+    """
+    Collects the :class:`FitResult` of every :func:`fit` in this process while inside the ``with`` block.
+    Fits in the worker processes of :func:`auto` are not collected.
+
+    Examples
+    ========
+    >>> with collect() as results:
+    ...     _ = fit([0, 1, 2, 3], [1, 3, 5, 7.1], polN(2))
+    >>> len(results), results[0].method
+    (1, 'linear')
+    """
+    results = []
+    _collectors.append(results)
+    try:
+        yield results
+    finally:
+        _collectors.remove(results)
+
+def _counted(f, counts, key):
+    """Returns ``f``, counting its calls in ``counts[key]``."""
+    def counted(*args):
+        counts[key] += 1
+        return f(*args)
+    counted.__signature__ = inspect.signature(f)
+    return counted
+
+def _fixed(function, fixed_params=True, kwargs={}):
+    """Returns the parameters of ``function`` fixed by ``kwargs`` as dict, if ``fixed_params``."""
+    names = list(inspect.signature(function).parameters)[1:]
+    return {a: kwargs[a] for a in names if a in kwargs} if fixed_params else {}
+
+def _guess(function, x, y, fixed={}):
+    """
+    Returns the parameters not in ``fixed`` of ``function.guess(x, y)`` with non-finite values replaced by one,
+    or None if ``function`` has no guess.
+    """
+    if not hasattr(function, 'guess'):
+        return None
+    if np.any(np.diff(x) < 0): # the heuristics expect sorted x
+        order = np.argsort(x)
+        x, y = x[order], y[..., order]
+    with np.errstate(all='ignore'):
+        guess = np.asarray(function.guess(x, y), dtype=float)
+    names = list(inspect.signature(function).parameters)[1:]
+    guess = guess[..., [i for i, a in enumerate(names) if a not in fixed]]
+    return np.where(np.isfinite(guess), guess, 1.)
+
+def _jacobian(function, fixed={}, symbolic=None):
+    """
+    Returns the analytic jacobian ``(jac, jac_x)`` of ``function`` without the ``fixed`` parameters,
+    or None if ``symbolic`` is off or sympy can not derive it. The latter warns, if ``symbolic`` was requested.
+    """
+    requested = symbolic
+    if symbolic is None:
+        symbolic = getattr(function, '__module__', None) == polN.__module__ # smpl2.functions
+    jacobian = get_jacobian(function) if symbolic else None
+    if requested and jacobian is None:
+        warnings.warn(f"sympy can not derive {getattr(function, '__name__', function)}, "
+                      "falling back to finite differences.", RuntimeWarning, stacklevel=3)
+    if jacobian is None or not fixed:
+        return jacobian
+    jac, jac_x = jacobian
+    names = list(inspect.signature(function).parameters)[1:]
+    free = [i for i, a in enumerate(names) if a not in fixed]
+
+    def full(params):
+        params = iter(params)
+        return [fixed[a] if a in fixed else next(params) for a in names]
+
+    return (lambda x, *params: jac(x, *full(params))[..., free],
+            lambda x, *params: jac_x(x, *full(params)))
+
+def _fitted(function, pfit, fixed_params=True, kwargs={}):
+    """Returns ``function`` evaluated at ``pfit``, with fixed parameters from ``kwargs`` if ``fixed_params``."""
+    function = reduce_function(function, **_fixed(function, fixed_params, kwargs))
+    return lambda x: function(x, *pfit)
+
+def fit_many(datax, datay, function, params=None, maxiter=200, ftol=1.49012e-8, xtol=1.49012e-8, symbolic=None, weights=None,
+             full_output=False, **kwargs):
+    """
+    Returns fits of ``function`` to every row of ``datay``, all sharing ``datax``.
+    All datasets are solved together by a vectorized Levenberg-Marquardt,
+    which evaluates residuals and Jacobians for the whole batch at once.
+    Uncertainties of ``datax`` are ignored.
+
+    Parameters
+    ==========
+    datax : array_like
+        X data of shape ``(n,)``, either as ``unp.uarray`` or ``np.array`` or ``list``
+    datay : array_like
+        Y data of shape ``(k, n)``, either as ``unp.uarray`` or ``np.array`` or ``list``.
+        Uncertainties are used as weights if all of them are non-zero.
+    function : func
+        Fit function with parameters: ``x``, ``*params``. It must broadcast
+        ``x`` of shape ``(1, n)`` against parameters of shape ``(k, 1)``.
+    params : array_like, optional
+        starting fit parameters, either shared ``(p,)`` or per dataset ``(k, p)``.
+        The default is the ``guess`` of ``function`` per dataset, or ones as for ``curve_fit``.
+    maxiter : int, optional
+        maximum number of iterations. The default is 200.
+    ftol, xtol : float, optional
+        relative tolerances on the chi-square and the parameters, as for ``curve_fit``.
+    symbolic : bool, optional
+        Whether to use the analytic jacobian instead of finite differences, see :func:`fit`.
+    weights : array_like, optional
+        additional weights of the points, broadcast against ``datay``, e.g. resampling counts. Zero drops a point.
+    full_output : bool, optional
+        Whether to also return which datasets converged.
+    **kwargs :
+        fixed parameters for ``function``.
+
+    Returns
+    -------
+    pfit : np.ndarray
+        optimized fit parameters of shape ``(k, p)``.
+    pcov : np.ndarray
+        covariance matrices of shape ``(k, p, p)``, scaled by the reduced chi-square.
+    converged : np.ndarray
+        only with ``full_output``, whether the fit of each dataset met ``ftol`` or ``xtol`` within ``maxiter``.
+    """
+    x = np.asarray(unv(datax), dtype=float)
+    y = np.atleast_2d(unv(datay)).astype(float)
+    yerr = np.atleast_2d(usd(datay)).astype(float)
+    if np.any(yerr == 0): yerr = np.ones_like(y)
+    if weights is not None:
+        with np.errstate(divide='ignore'):
+            yerr = yerr / np.sqrt(weights)
+    k, n = y.shape
+    assert len(x) == n
+
+    fixed = _fixed(function, True, kwargs)
+    names = [a for a in list(inspect.signature(function).parameters)[1:] if a not in fixed]
+
+    def model(p):
+        """Evaluates ``function`` for every row of ``p`` at once."""
+        f = function(x[None, :], **fixed, **{a: p[:, i, None] for i, a in enumerate(names)})
+        return np.broadcast_to(np.asarray(f, dtype=float), (len(p), n))
+
+    analytic = _jacobian(function, fixed, symbolic)
+
+    def jacobian(p, f):
+        """Jacobian of ``model`` in every parameter, shape ``(k, n, p)``. Forward differences without ``analytic``."""
+        if analytic is not None:
+            return analytic[0](x[None, :], *[p[:, i, None] for i in range(len(names))])
+        jac = np.empty(f.shape + (len(names),))
+        for i in range(len(names)):
+            h = np.sqrt(np.finfo(float).eps) * np.maximum(np.abs(p[:, i]), 1)
+            q = p.copy()
+            q[:, i] += h
+            jac[..., i] = (model(q) - f) / h[:, None]
+        return jac
+
+    def solve(a, b):
+        try:
+            return np.linalg.solve(a, b[..., None])[..., 0]
+        except LinAlgError: # some system is singular, fall back to least squares
+            return (np.linalg.pinv(a) @ b[..., None])[..., 0]
+
+    if params is None:
+        params = _guess(function, x, y, fixed)
+    p = np.broadcast_to(np.ones(len(names)) if params is None else np.asarray(params, dtype=float), (k, len(names))).copy()
+    f = model(p).copy()
+    chi2 = np.sum(((f - y) / yerr)**2, axis=1)
+    lam = np.full(k, 1e-3)
+    converged = np.zeros(k, dtype=bool)
+    active = np.flatnonzero(np.isfinite(chi2))
+    for _ in range(maxiter):
+        if len(active) == 0: break
+        w = 1 / yerr[active]
+        jac = jacobian(p[active], f[active]) * w[..., None]
+        r = (y[active] - f[active]) * w
+        jtj = jac.transpose(0, 2, 1) @ jac
+        grad = (jac.transpose(0, 2, 1) @ r[..., None])[..., 0]
+        diag = np.einsum('kii->ki', jtj)
+        step = solve(jtj + (lam[active, None] * np.maximum(diag, 1e-12))[..., None] * np.eye(len(names)), grad)
+
+        q = p[active] + step
+        g = model(q)
+        new = np.sum(((g - y[active]) * w)**2, axis=1)
+        better = new < chi2[active] # False for nan
+        tolerance = (better & (chi2[active] - new <= ftol * chi2[active])) \
+                  | np.all(np.abs(step) <= xtol * (np.abs(p[active]) + xtol), axis=1)
+        done = tolerance | (lam[active] > 1e16)
+        converged[active[tolerance]] = True
+
+        idx = active[better]
+        p[idx], f[idx], chi2[idx] = q[better], g[better], new[better]
+        lam[active] = np.where(better, lam[active] / 10, lam[active] * 10)
+        active = active[~done]
+
+    w = 1 / yerr
+    jac = jacobian(p, f) * w[..., None]
+    pcov = np.linalg.pinv(jac.transpose(0, 2, 1) @ jac)
+    pcov *= (chi2 / (n - len(names)) if n > len(names) else np.full(k, np.inf))[:, None, None]
+    if full_output:
+        return p, pcov, converged
+    return p, pcov
+
+def bootstrap(datax, datay, function, n=1000, params=None, mode='pairs', confidence=0.6827, workers=None, batch=256, seed=None, **kwargs):
+    """
+    Returns bootstrap estimates of the parameters of ``function`` fitted to ``datax`` and ``datay``.
+    All ``n`` replicas are drawn in one step and fitted in batches by :func:`fit_many`,
+    in this process or spread over ``workers`` forked processes where ``fork`` is available (opt-in).
+    Replicas whose fit did not converge are dropped.
+    Uncertainties of ``datax`` are ignored.
+
+    Parameters
+    ==========
+    datax : array_like
+        X data either as ``unp.uarray`` or ``np.array`` or ``list``
+    datay : array_like
+        Y data either as ``unp.uarray`` or ``np.array`` or ``list``. Uncertainties are used as weights.
+    function : func
+        Fit function with parameters: ``x``, ``*params``, see :func:`fit_many`.
+    n : int, optional
+        number of replicas. The default is 1000.
+    params : tuple, optional
+        starting fit parameters of the reference fit, which warm-starts the replicas.
+    mode : 'pairs', 'residuals', 'montecarlo', optional
+        How replicas are drawn:
+         - ``pairs``: resample the data points with replacement
+         - ``residuals``: add resampled (standardized) residuals of the reference fit to it
+         - ``montecarlo``: add gaussian noise of the uncertainties of ``datay`` to it
+        The default is ``pairs``.
+    confidence : float, optional
+        probability of the central percentile interval. The default of one sigma.
+    batch : int, optional
+        replicas per :func:`fit_many` call.
+    seed : int or np.random.Generator, optional
+        seed of the resampling.
+    **kwargs :
+        fixed parameters for ``function``, as well as for ``data_split`` and :func:`fit_many`.
+
+    Returns
+    -------
+    pfit : tuple
+        medians of the parameters with half the percentile interval as uncertainty, correlated as the replicas.
+    samples : np.ndarray
+        fitted parameters of the converged replicas of shape ``(n, p)``.
+    """
+    x, y, xerr, yerr = data_split(datax, datay, **kwargs)
+    kwargs = {k: v for k, v in kwargs.items() if k not in ('range', 'selector', 'mode')} # used by data_split
+    rng = np.random.default_rng(seed)
+    w = np.ones_like(y) if yerr is None else 1 / yerr**2
+    pfit = fit_many(x, y, function, params=params, weights=w, **kwargs)[0][0]
+    fy = _fitted(function, pfit, True, kwargs)(x)
+    if mode == 'pairs':
+        weights = rng.multinomial(len(x), np.full(len(x), 1/len(x)), size=n) * w
+        ys = np.broadcast_to(y, (n, len(x)))
+    elif mode == 'residuals':
+        scale = 1 if yerr is None else yerr
+        ys = fy + scale * ((y - fy) / scale)[rng.integers(0, len(x), (n, len(x)))]
+        weights = np.broadcast_to(w, (n, len(x)))
+    elif mode == 'montecarlo':
+        if yerr is None: raise ValueError("montecarlo needs uncertainties of datay")
+        ys = y + yerr * rng.standard_normal((n, len(x)))
+        weights = np.broadcast_to(w, (n, len(x)))
     else:
-        pfit = _fit_curvefit(x, y, unv_lambda(function), params=params, yerr=yerr, **kwargs)
+        raise ValueError("unknown mode %s" % mode)
+
+    batches = [slice(i, i + batch) for i in range(0, n, batch)]
+    state = x, ys, weights, function, pfit, kwargs
+    workers = min(workers or 1, len(batches))
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        _bootstrap_init(*state)
+        samples = [_bootstrap_batch(s) for s in batches]
+    else: # forked workers inherit the replicas and the cached model wrappers
+        ctx = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_bootstrap_init, initargs=state) as pool:
+            samples = list(pool.map(_bootstrap_batch, batches))
+    samples, converged = (np.concatenate(part) for part in zip(*samples))
+    samples = samples[converged & np.all(np.isfinite(samples), axis=1)]
 
-    return lambda x: function(x, *pfit), pfit
+    center = np.median(samples, axis=0)
+    low, high = np.percentile(samples, [50 * (1 - confidence), 50 * (1 + confidence)], axis=0)
+    s = (high - low) / 2
+    cov = np.atleast_2d(np.corrcoef(samples, rowvar=False)) * np.outer(s, s)
+    return unc.correlated_values(center, cov), samples
+
+_bootstrap_state = None
+
+def _bootstrap_init(*state):
+    global _bootstrap_state
+    _bootstrap_state = state
+
+def _bootstrap_batch(s):
+    """Fits the replicas in slice ``s`` of :func:`bootstrap`."""
+    x, ys, weights, function, params, kwargs = _bootstrap_state
+    pfit, pcov, converged = fit_many(x, ys[s], function, params=params, weights=weights[s], full_output=True, **kwargs)
+    return pfit, converged
+
+class Incremental_Fit:
+    """
+    Fits ``function`` to data arriving in chunks, refitting after every :meth:`add` from the previous parameters.
+
+    Models linear in their (free) parameters are updated exactly by recursive least squares:
+    the weighted normal equations are accumulated, so adding or dropping points costs O(p²) independent of the history.
+    Other models are refitted by :func:`fit` on the kept data, warm-started from the last solution.
+    If that fails or fits worse (in chi2/ndf) than the last refit, they are also refitted from ``params``
+    and the better of both is kept, so a bad early optimum is not locked in.
+    Uncertainties of ``datax`` are only used by refits of nonlinear models.
+
+    Parameters
+    ==========
+    function : func
+        Fit function with parameters: ``x``, ``*params``
+    params : tuple, optional
+        starting fit parameters for nonlinear models. None uses the ``guess`` of ``function``.
+    window : int, optional
+        only fit the last ``window`` points. The default None keeps every point.
+    **kwargs :
+        fixed parameters and options of :func:`fit`.
+
+    Examples
+    ========
+    >>> from smpl2.functions import line
+    >>> f = Incremental_Fit(line, window=3)
+    >>> _ = f.add([0, 1, 2], [1, 3, 5])
+    >>> _ = f.add([3], [10])
+    >>> [round(p.n, 6) for p in f.pfit]
+    [3.5, -1.0]
+
+    Streaming a nonlinear model ends at the same parameters as a fit of all points at once:
+
+    >>> from smpl2.functions import gauss
+    >>> x = np.linspace(-5, 5, 200)
+    >>> y = gauss(x, 0.3, 2, 1, 0.1) + np.random.default_rng(0).normal(0, 0.01, 200)
+    >>> f = Incremental_Fit(gauss)
+    >>> for i in range(0, 200, 10):
+    ...     _ = f.add(x[i:i + 10], y[i:i + 10])
+    >>> np.allclose(unv(f.pfit), unv(fit(x, y, gauss).pfit), rtol=1e-4)
+    True
+    """
+    def __init__(self, function, params=None, window=None, fixed_params=True, symbolic=None, **kwargs):
+        self.function = function
+        self.window = window
+        self.params = params
+        self.pfit = None
+        self._start, self._chi2_ndf = params, np.inf
+        self.datax, self.datay = None, None
+        self.kwargs = dict(kwargs, fixed_params=fixed_params, symbolic=symbolic)
+        fixed = _fixed(function, fixed_params, kwargs)
+        free = [a for a in list(inspect.signature(function).parameters)[1:] if a not in fixed]
+        self._model = reduce_function(function, **fixed)
+        self._function = unv_lambda(self._model) # nominal values for the normal equations
+        jacobian = _jacobian(function, fixed, symbolic)
+        self._jac = jacobian[0] if jacobian is not None and is_linear(function, *free) else None
+        # accumulated normal equations for linear models
+        self._a, self._b, self._yy, self._n = np.zeros((len(free), len(free))), np.zeros(len(free)), 0., 0
+
+    def add(self, datax, datay):
+        """
+        Appends the points ``datax``, ``datay`` (dropping those outside the window) and refits.
+        Returns ``(ffit, pfit)`` like :func:`fit`, ``pfit`` is None while there are not enough points.
+        """
+        datax, datay = np.atleast_1d(datax), np.atleast_1d(datay)
+        assert len(datax) == len(datay)
+        if self.window is not None or self._jac is None:
+            self.datax = datax if self.datax is None else np.concatenate([self.datax, datax])
+            self.datay = datay if self.datay is None else np.concatenate([self.datay, datay])
+        if self._jac is not None:
+            self._accumulate(datax, datay, 1)
+        if self.window is not None and len(self.datax) > self.window:
+            drop = len(self.datax) - self.window
+            if self._jac is not None:
+                self._accumulate(self.datax[:drop], self.datay[:drop], -1)
+            self.datax, self.datay = self.datax[drop:], self.datay[drop:]
+
+        if self._jac is not None:
+            self._solve()
+        elif len(self.datax) > len(self._b):
+            results = [self._refit(self.params)]
+            if self.params is not self._start and (results[0] is None or results[0].chi2_ndf > self._chi2_ndf):
+                results.append(self._refit(self._start))
+            results = [r for r in results if r is not None]
+            if results:
+                result = min(results, key=lambda r: r.chi2)
+                self.pfit, self.params, self._chi2_ndf = result.pfit, unv(result.pfit), result.chi2_ndf
+        return _fitted(self._model, self.pfit) if self.pfit is not None else None, self.pfit
+
+    def __call__(self, x):
+        """Returns the current fit evaluated at ``x``."""
+        return _fitted(self._model, self.pfit)(x)
+
+    def _refit(self, params):
+        """Returns the converged :func:`fit` of the kept data from ``params`` or None."""
+        try:
+            result = fit(self.datax, self.datay, self.function, params=params, **self.kwargs)
+        except (ValueError, LinAlgError): # e.g. parameters not determined by the data yet
+            return None
+        return result if result.success and np.isfinite(result.chi2) else None
+
+    def _accumulate(self, datax, datay, sign):
+        """Adds (``sign=1``) or removes (``sign=-1``) points from the normal equations."""
+        x = np.asarray(unv(datax), dtype=float)
+        y, yerr = np.asarray(unv(datay), dtype=float), np.asarray(usd(datay), dtype=float)
+        w = np.ones_like(y) if np.any(yerr == 0) else 1 / yerr**2
+        zeros = np.zeros(len(self._b))
+        a = np.reshape(self._jac(x, *zeros), (len(x), len(zeros)))
+        y = y - self._function(x, *zeros) # offset of fixed parameters
+        self._a += sign * (a.T * w) @ a
+        self._b += sign * (a.T * w) @ y
+        self._yy += sign * np.sum(w * y**2)
+        self._n += sign * len(x)
+
+    def _solve(self):
+        p = len(self._b)
+        if self._n <= p:
+            self.pfit = None
+            return
+        try:
+            pfit = np.linalg.solve(self._a, self._b)
+            pcov = np.linalg.inv(self._a)
+        except LinAlgError:
+            self.pfit = None
+            return
+        chi2 = max(self._yy - 2 * pfit @ self._b + pfit @ self._a @ pfit, 0.)
+        self.params = pfit
+        self.pfit = unc.correlated_values(pfit, pcov * chi2 / (self._n - p))
 
 def data_split(datax, datay, range=(None,None), selector=None, mode='all', **kwargs):
     """
@@ -133,23 +718,63 @@ def data_split(datax, datay, range=(None,None), selector=None, mode='all', **kwa
 # https://stackoverflow.com/questionsquestions/14581358/getting-standard-errors-on-fitted-parameters-using-the-optimize-leastsq-method-i#
 # Updated on 4/6/2016
 # User: https://stackoverflow.com/users/1476240/pedro-m-duarte
-def _fit_curvefit(datax, datay, function, params=None, yerr=None, epsfcn=0.0001, maxfev=10000, **kwargs):
+def _fit_curvefit(datax, datay, function, params=None, yerr=None, epsfcn=0.0001, maxfev=10000, jacobian=None, **kwargs):
+    if jacobian is not None:
+        kwargs.setdefault('jac', jacobian[0])
+    if kwargs.get('method', 'trf' if 'bounds' in kwargs else 'lm') == 'lm':
+        kwargs['epsfcn'] = epsfcn # only known to leastsq
+    if params is not None and isinstance(kwargs.get('bounds'), (tuple, list)):
+        params = np.clip(params, *kwargs['bounds']) # e.g. a guess from the data outside the bounds
     try:
-        pfit, pcov = optimize.curve_fit(function, datax, datay, p0=params, sigma=yerr, epsfcn=epsfcn, maxfev=maxfev, **kwargs)
-    except RuntimeError:
-        return params
-    return unc.correlated_values(pfit,pcov)
+        pfit, pcov, info, message, ier = optimize.curve_fit(function, datax, datay, p0=params, sigma=yerr,
+                                                            maxfev=maxfev, full_output=True, **kwargs)
+    except RuntimeError as e:
+        return params, {'success': False, 'message': str(e)}
+    return unc.correlated_values(pfit,pcov), {'success': ier in (1, 2, 3, 4), 'message': message, 'chi2': np.sum(info['fvec']**2)}
+
+def _fit_linear(datax, datay, function, jac, yerr=None, absolute_sigma=False):
+    """
+    Solves a model linear in its parameters by a QR decomposition of the weighted design matrix ``jac``.
+    Like ``curve_fit``, the covariance is scaled by the reduced chi-square unless ``absolute_sigma``.
+    A rank deficient design matrix does not determine the parameters and is reported as failure.
+    """
+    p = len(inspect.signature(function).parameters) - 1
+    zeros = np.zeros(p)
+    w = np.ones_like(datay) if yerr is None else 1 / yerr
+    a = jac(datax, *zeros) * w[:, None]
+    b = (datay - function(datax, *zeros)) * w
+    q, r = np.linalg.qr(a)
+    diag = np.abs(np.diag(r))
+    if len(diag) < p or not np.all(diag > max(a.shape) * np.finfo(float).eps * diag.max()):
+        pfit = np.linalg.lstsq(a, b, rcond=None)[0]
+        return tuple(unc.ufloat(v, np.inf) for v in pfit), {'success': False, 'chi2': np.sum((a @ pfit - b)**2),
+                                                            'message': 'Design matrix is rank deficient, parameters are not determined.'}
+    pfit = solve_triangular(r, q.T @ b)
+    rinv = solve_triangular(r, np.eye(p))
+    chi2 = np.sum((a @ pfit - b)**2)
+    pcov = rinv @ rinv.T
+    if not absolute_sigma:
+        pcov = pcov * (chi2 / (len(b) - p) if len(b) > p else np.inf)
+    return unc.correlated_values(pfit, pcov), {'message': 'Solved linear least squares.', 'chi2': chi2}
 
 # Note Issues on scipy odr and curve_fit, regarding different definitions/namings of standard deviation or error and covaraince matrix
 # https://github.com/scipy/scipy/issues/6842
 # https://github.com/scipy/scipy/pull/12207
 # https://stackoverflow.com/questions/62460399/comparison-of-curve-fit-and-scipy-odr-absolute-sigma
-def _fit_odr(datax, datay, function, params=None, yerr=None, xerr=None):
-    model = Model(lambda p,x : function(x,*p))
+def _fit_odr(datax, datay, function, params=None, yerr=None, xerr=None, jacobian=None, **kwargs):
+    if jacobian is None:
+        model = Model(lambda p,x : function(x,*p))
+    else:
+        jac, jac_x = jacobian
+        model = Model(lambda p,x : function(x,*p), fjacb=lambda p,x : jac(x,*p).T, fjacd=lambda p,x : jac_x(x,*p))
     realdata = RealData(datax, datay, sy=yerr, sx=xerr)
     odr = ODR(realdata, model, beta0=params)
+    if jacobian is not None:
+        odr.set_job(deriv=3) # use the analytic derivatives unchecked
     out = odr.run()
-    return unc.correlated_values(out.beta, out.cov_beta)
+    # info 1-3 are convergence, 4 the iteration limit and above errors
+    return unc.correlated_values(out.beta, out.cov_beta), {'success': out.info < 4, 'message': '; '.join(out.stopreason),
+                                                         'chi2': out.sum_square}
 
 if __name__ == "__main__":
     import doctest
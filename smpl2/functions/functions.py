@@ -1,75 +1,221 @@
 import numpy as np
 import uncertainties.unumpy as unp
+from smpl2.uarray import Uncertain_Array
+
+def _symbolic(x):
+    """True, if ``x`` is a sympy expression, e.g. while deriving a jacobian in :func:`smpl2.wrap.get_jacobian`."""
+    return type(x).__module__.startswith('sympy')
+
+def _dispatch(np_func, unp_func):
+    """
+    Returns ``np_func`` for plain numbers and ``unp_func`` for ufloat arrays, which is much slower.
+    :class:`smpl2.uarray.Uncertain_Array` propagates its uncertainties through ``np_func``.
+    Sympy expressions use the sympy function of the same name.
+    """
+    def func(x):
+        if _symbolic(x):
+            import sympy
+            return getattr(sympy, np_func.__name__)(x)
+        if isinstance(x, Uncertain_Array):
+            return np_func(x)
+        return unp_func(x) if np.asarray(x).dtype == object else np_func(x)
+    return func
+
+def _where(cond, a, b):
+    """``np.where``, which becomes a ``sympy.Piecewise`` for symbolic conditions."""
+    if _symbolic(cond):
+        import sympy
+        return sympy.Piecewise((a, cond), (b, True))
+    return np.where(cond, a, b)
+
+_cos = _dispatch(np.cos, unp.cos)
+_sin = _dispatch(np.sin, unp.sin)
+_tan = _dispatch(np.tan, unp.tan)
+_exp = _dispatch(np.exp, unp.exp)
+_log = _dispatch(np.log, unp.log)
+_sqrt = _dispatch(np.sqrt, unp.sqrt)
+
+def _guess(guess):
+    """
+    Attaches ``guess(x, y)`` to a model, an O(n) heuristic of its parameters used as starting point by :mod:`smpl2.fit`.
+    ``x`` is sorted and roughly equidistant with shape ``(n,)``, ``y`` has shape ``(..., n)`` and the guess ``(..., params)``.
+    """
+    def decorate(func):
+        func.guess = guess
+        return func
+    return decorate
+
+def _stack(*params):
+    return np.stack(np.broadcast_arrays(*params), axis=-1)
+
+def _linefit(x, y, w=1):
+    """Returns slope and intercept of a weighted least squares line through ``y`` over ``x`` along the last axis."""
+    w = np.broadcast_to(w, np.broadcast(x, y).shape)
+    sw = np.sum(w, axis=-1)
+    mx, my = np.sum(w*x, axis=-1) / sw, np.sum(w*y, axis=-1) / sw
+    dx = x - mx[..., None]
+    slope = np.sum(w*dx*(y - my[..., None]), axis=-1) / np.sum(w*dx**2, axis=-1)
+    return slope, my - slope*mx
+
+def _peak(x, y):
+    """Returns position, height, baseline and the left and right half widths at half maximum of the largest peak or dip."""
+    base = np.median(y, axis=-1)
+    dev = y - base[..., None]
+    i = np.argmax(np.abs(dev), axis=-1)
+    height = np.take_along_axis(dev, i[..., None], axis=-1)[..., 0]
+    x0 = x[i]
+    dx = np.gradient(x)
+    above = dev / height[..., None] > 0.5
+    left = np.sum(above * dx * (x < x0[..., None]), axis=-1) + dx[i]/2
+    right = np.sum(above * dx * (x > x0[..., None]), axis=-1) + dx[i]/2
+    return x0, height, base, left, right
+
+def _periodic(x, y):
+    """Returns amplitude, frequency and cosine phase of the strongest fourier mode of ``y`` without its mean."""
+    n = x.shape[-1]
+    c = np.fft.rfft(y - np.mean(y, axis=-1, keepdims=True), axis=-1)
+    k = np.argmax(np.abs(c[..., 1:]), axis=-1) + 1
+    ck = np.take_along_axis(c, k[..., None], axis=-1)[..., 0]
+    f = k / (n * (x[-1] - x[0]) / (n - 1))
+    return 2*np.abs(ck)/n, f, x[0] - np.angle(ck)/(2*np.pi*f)
 
 #from smpl2 import doc
 
 #@doc.append_plot(4)
+@_guess(lambda x, y: np.mean(y, axis=-1)[..., None])
 def const(x, m):
     """$m$"""
     return np.ones(np.shape(x))*m
 
 #@doc.append_plot(2)
+@_guess(lambda x, y: (np.sum(x*y, axis=-1) / np.sum(x*x))[..., None])
 def linear(x, a):
     """$a \\cdot x$"""
     return a*x
 
 #@doc.append_plot(2,-1)
+@_guess(lambda x, y: _stack(*_linefit(x, y)))
 def line(x, a, b):
     """$a \\cdot x + b$"""
     return a*x + b
 
+def _guess_cos_abs(x, y):
+    # |cos| oscillates with twice the frequency and averages to 2/pi
+    a, f, phi = _periodic(x, y)
+    return _stack(np.mean(y, axis=-1)*np.pi/2, f/2, phi)
+
 #@doc.append_plot(3,0.02,3)
+@_guess(_guess_cos_abs)
 def cos_abs(x, a, f, phi):
     """$a \\cdot |\\cos(2πf(x-\\phi))|$"""
-    return a * np.abs(unp.cos(2*np.pi*f*(x-phi)))
+    return a * np.abs(_cos(2*np.pi*f*(x-phi)))
 
 #@doc.append_plot(3,0.02,3)
+@_guess(lambda x, y: _stack(*_periodic(x, y)))
 def cos(x, a, f, phi):
     """$a \\cdot \\cos(2πf(x-\\phi))$"""
-    return a * unp.cos(2*np.pi*f*(x-phi))
+    return a * _cos(2*np.pi*f*(x-phi))
+def _guess_sin(x, y):
+    a, f, phi = _periodic(x, y)
+    return _stack(a, f, phi - 1/(4*f))
+
 #@doc.append_plot(3,0.02,3)
+@_guess(_guess_sin)
 def sin(x, a, f, phi):
     """$a \\cdot \\sin(2πf(x-\\phi))$"""
-    return a * unp.sin(2*np.pi*f*(x-phi))
+    return a * _sin(2*np.pi*f*(x-phi))
 #@doc.append_plot(3,0.02,3)
 def tan(x, a, f, phi):
     """$a \\cdot \\tan(2πf(x-\\phi))$"""
-    return a * unp.tan(2*np.pi*f*(x-phi))
+    return a * _tan(2*np.pi*f*(x-phi))
+
+def _guess_lorentz(x, y):
+    x0, height, base, left, right = _peak(x, y)
+    d = (left + right)/2 # half width at half maximum
+    return _stack(x0, height*np.pi*d, d, base)
 
 #@doc.append_plot(0,5,3,0)
+@_guess(_guess_lorentz)
 def lorentz(x,x_0,A,d,y):
     """$\\frac{A}{\\pi d \\left(1 + \\left(\\frac{x-x_0}{d}\\right)^2 \\right)} + y$"""
     return 1/(np.pi*d*(1+(x-x_0)**2/d**2))*A + y
 
+_HWHM = np.sqrt(2*np.log(2)) # half width at half maximum of a unit gaussian
+
+def _guess_gauss(x, y):
+    x0, height, base, left, right = _peak(x, y)
+    return _stack(x0, height, (left + right)/2/_HWHM, base)
+
 #@doc.append_plot(0,5,3,0)
+@_guess(_guess_gauss)
 def gauss(x, x_0, A, d, y):
     """$A\\cdot \\exp\\left(\\frac{-(x-x_0)^2}{2d^2}\\right)+y$"""
-    return A * unp.exp(-(x - x_0)**2 / 2 / d**2) + y
+    return A * _exp(-(x - x_0)**2 / 2 / d**2) + y
+
+def _guess_exp(x, y):
+    # regression of log|y| over x
+    c, log_y0 = _linefit(x, np.log(np.where(y != 0, np.abs(y), 1)), y != 0)
+    return _stack(c, np.sign(np.sum(y, axis=-1)) * np.exp(log_y0))
 
 #@doc.append_plot(0.5,4)
+@_guess(_guess_exp)
 def exp(x, c, y_0):
     """$y_0 \\cdot \\exp(cx)$"""
-    return unp.exp(c * x) * y_0
+    return _exp(c * x) * y_0
+
+def _guess_log(x, y):
+    # regression of y over log(x) = y_0 log(x) + y_0 log(c)
+    y0, intercept = _linefit(np.log(np.where(x > 0, x, 1)), y, x > 0)
+    return _stack(np.exp(intercept / y0), y0)
 
 #@doc.append_plot(0.5,4,xmin=0.1)
+@_guess(_guess_log)
 def log(x, c, y_0):
     """$y_0 \\cdot \\log(cx)$"""
-    return unp.log(c * x) * y_0
+    return _log(c * x) * y_0
+
+def _guess_order(x, y):
+    # a and y_0 are linear for fixed x_0 and k, so try a small grid of those and keep the best line fit
+    span = x[-1] - x[0]
+    best, best_sq = None, None
+    for x0 in x[0] - span * np.array([1/len(x), 0.1, 0.5, 1]):
+        for k in (-1, 0.5, 1, 1.5, 2, 3):
+            a, y0 = _linefit((x - x0)**k, y)
+            sum_sq = np.sum((a[..., None]*(x - x0)**k + y0[..., None] - y)**2, axis=-1)
+            guess = _stack(x0, a, k, y0)
+            if best is None:
+                best, best_sq = guess, sum_sq
+            else:
+                better = sum_sq < best_sq
+                best, best_sq = np.where(better[..., None], guess, best), np.where(better, sum_sq, best_sq)
+    return best
 
 #@doc.append_plot(1,3.3,-1,xmin=0)
+@_guess(_guess_order)
 def order(x,x0,a,k,y):
     """$a \\cdot (x-x_0)^k + y_0$"""
     return a*(x-x0)**k+y
 
+def _guess_sqrt(x, y):
+    x0 = x[0] - (x[-1] - x[0]) / len(x)
+    a, y0 = _linefit(np.sqrt(x - x0), y)
+    return _stack(x0, a, 1., y0)
+
 #@doc.append_plot(1,3.3,0,xmin=0)
+@_guess(_guess_sqrt)
 def sqrt(x,x0,a,b,y0):
     """$a \\sqrt{b \\cdot (x-x_0)} + y_0$"""
-    return a*unp.sqrt(b*(x-x0)) + y0
+    return a*_sqrt(b*(x-x0)) + y0
+
+def _guess_split_gauss(x, y):
+    x0, height, base, left, right = _peak(x, y)
+    return _stack(x0, height, right/_HWHM, left/_HWHM, base)
 
 #@doc.append_plot(0,1,2,3,0)
+@_guess(_guess_split_gauss)
 def split_gauss(x,x0,a,d0,d1,y0):
     """$a \\cdot \\exp\\left(\\frac{-(x-x_0)^2}{2d_0^2}\\right)+y_0$, for $x>x_0$\n$a \\cdot \\exp\\left(\\frac{-(x-x_0)^2}{2d_1^2}\\right)+y_0$, for $x<x_0$"""
-    return np.where(x>x0,gauss(x,x0,a,d0,y0), gauss(x,x0,a,d1,y0))
+    return _where(x>x0,gauss(x,x0,a,d0,y0), gauss(x,x0,a,d1,y0))
 
 def pol1(N):
     """Returns a single polynomial of N-th order."""
@@ -77,6 +223,11 @@ def pol1(N):
     def pol(x,a,x0,y0):
         return a * (x-x0)**N + y0
     pol.__doc__ = "$a \\cdot (x-x_0)^{%i} + y_0$" % N
+    def guess(x, y):
+        x0 = np.mean(x)
+        a, y0 = _linefit((x - x0)**N, y)
+        return _stack(a, x0, y0)
+    pol.guess = guess
     return pol
 
 def polN(N):
@@ -86,4 +237,5 @@ def polN(N):
     func = "lambda x,{var}: {func}".format(var=','.join(['a%i'%i for i in range(N+1)]), func=func)
     func = eval(func)
     func.__doc__ = '$' + ' + '.join(["a_{%i} \\cdot x^{%i}" % (i,i) for i in range(N,1,-1)]) + " + a_1 \\cdot x + a_0$"
+    func.guess = lambda x, y: np.moveaxis(np.polynomial.polynomial.polyfit(x, np.reshape(y, (-1, len(x))).T, N).reshape((N+1,) + np.shape(y)[:-1]), 0, -1)
     return func
@@ -1,6 +1,7 @@
 from collections.abc import Iterable
 from itertools import chain, count
 from smpl2 import io
+from smpl2.uarray import Uncertain_Array
 import numpy as np
 
 def _filename(path, file):
@@ -63,6 +64,8 @@ def toSI(val=None, unit=None, bonus=None):
 
 def latexify(val, comma=False, parenthesis=True):
     """Return the refactored string of a value with uncertainty."""
+    if isinstance(val, Uncertain_Array) and val.ndim: # per element, like a unp.uarray
+        val = val.to_unumpy()
     s = str(val)
     s = s.replace('+/-', ' \\pm ') # plus minus with latex notation
     if comma: s = s.replace('.', ',') # german comma, can be ignored in latex setup
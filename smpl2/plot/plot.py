@@ -3,7 +3,7 @@ import matplotlib.pyplot as plt
 import matplotlib.pylab as pylab
 import matplotlib
 from matplotlib import colors as mcolors
-from uncertainties.unumpy import nominal_values as unv
+from smpl2.uarray import unv
 #from uncertainties.unumpy import std_devs as usd
 from smpl2 import io, fit
 
@@ -65,7 +65,7 @@ def plt_data(datax, datay, plt_xerr=None, plt_yerr=None, color="C0", zorder=20,
     x, y, xerr, yerr = fit.data_split(datax, datay, range=range, selector=selector, mode='any')
     if plt_xerr is False: xerr = None
     if plt_yerr is False: yerr = None
-    plt.errorbar(x, y, xerr=xerr, yerr=yerr, color=color, zorder=zorder **kwargs)
+    plt.errorbar(x, y, xerr=xerr, yerr=yerr, color=color, zorder=zorder, **kwargs)
 
 def plt_error(datax, datay, sigma=1, alpha=0.4, alphaData=0.7, label=None, color="C1", zorder=10, filltype="y", range=(None,None), selector=None, **kwargs):
     """
@@ -0,0 +1,6 @@
+"""
+Discrete probability distributions.
+"""
+from .probability import Discrete_Probability, Die, Dice, Dice_Keep, Dice_Keep_Sum, Lazy_Probability, Pruning, Frozen_Probability, Joint_Probability, Markov_Chain, random_streams, disk_cache
+
+__all__ = ['Discrete_Probability', 'Die', 'Dice', 'Dice_Keep', 'Dice_Keep_Sum', 'Lazy_Probability', 'Pruning', 'Frozen_Probability', 'Joint_Probability', 'Markov_Chain', 'random_streams', 'disk_cache']
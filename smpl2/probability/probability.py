@@ -1,7 +1,25 @@
-from collections import defaultdict
-from itertools import product
-from math import ceil, floor
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import wraps
+from hashlib import blake2b
+from inspect import signature
+from heapq import nlargest
+from itertools import groupby, product
+from types import BuiltinFunctionType, FunctionType, MappingProxyType
+import zipfile
+import operator
+from functools import reduce
+import os
+import re
+import struct
+from math import ceil, comb, floor, gcd, prod
+from multiprocessing.shared_memory import SharedMemory
 from typing import Callable, Generic, ItemsView, Iterator, Self, TypeVar
+import numpy as np
+from scipy import sparse
+from scipy.signal import fftconvolve
+from scipy.sparse.linalg import spsolve
+from smpl2 import io
 
 
 def _proba_string(propability: float):
@@ -9,13 +27,425 @@ def _proba_string(propability: float):
 
 T = TypeVar("T")
 
+_GRID_MAX_FILL = 16 # maximum number of grid slots per stored outcome
+_DIRECT_CONVOLVE = 2**24 # use the exact np.convolve up to this many products, FFT above
+_DENSE_POWER = 0.1 # fill ratio above which matrix powers switch to dense arrays
+_PARALLEL_MIN = 10**6 # minimum number of outcome pairs to use worker processes
+_PARALLEL_CHUNK = (2**18, 2**24) # minimum and maximum outcome pairs per worker task
+
+def _is_integer(key) -> bool:
+    return isinstance(key, (int, np.integer)) and not isinstance(key, (bool, np.bool_))
+
+def _integral(keys: np.ndarray, func: Callable) -> np.ndarray | None:
+    """Returns ``func(keys)`` (``np.floor`` or ``np.ceil``) as integers or None, if the results do not fit into int64."""
+    if keys.dtype.kind in "iu":
+        return keys
+    keys = func(keys)
+    if not np.all(np.abs(keys) < 2.**63): # also catches inf and nan
+        return None
+    return keys.astype(np.int64)
+
+class _Grid:
+    """
+    Dense representation of an integer distribution.
+    The probability ``probs[i]`` belongs to the outcome ``offset + step * i``.
+    """
+    __slots__ = ("offset", "step", "probs", "truncated")
+
+    def __init__(self, offset: int, step: int, probs: np.ndarray, truncated: float = 0.):
+        self.offset = offset
+        self.step = step
+        self.probs = probs
+        self.truncated = truncated # probability removed as FFT roundoff noise
+
+    @classmethod
+    def from_dict(cls, distribution: dict) -> "_Grid | None":
+        """
+        Returns the grid of ``distribution`` or None, if the support is not integer or too sparse.
+        Outcomes with probability 0 would vanish from the grid, so such distributions stay dicts.
+        """
+        if len(distribution) == 0 or not all(_is_integer(key) for key in distribution) or 0 in distribution.values():
+            return None
+        keys = [int(key) for key in distribution]
+        low, high = min(keys), max(keys)
+        step = 0
+        for key in keys:
+            step = gcd(step, key - low)
+        step = max(step, 1)
+        size = (high - low) // step + 1
+        if size > _GRID_MAX_FILL * len(distribution):
+            return None
+        probs = np.zeros(size)
+        index = np.array([(key - low) // step for key in keys], dtype=np.intp)
+        np.add.at(probs, index, np.fromiter(distribution.values(), dtype=float, count=len(distribution)))
+        return cls(low, step, probs)
+
+    def to_dict(self) -> dict[int, float]:
+        """Returns the nonzero outcomes as a dict."""
+        keys = range(self.offset, self.offset + self.step * len(self.probs), self.step)
+        return {key: value for key, value in zip(keys, self.probs.tolist()) if value != 0}
+
+    def count(self) -> int:
+        """Number of outcomes with nonzero probability."""
+        return int(np.count_nonzero(self.probs))
+
+    def regrid(self, step: int) -> "_Grid":
+        """Returns the same distribution on a finer grid, ``step`` must divide ``self.step``."""
+        if step == self.step:
+            return self
+        probs = np.zeros((len(self.probs) - 1) * (self.step // step) + 1)
+        probs[::self.step // step] = self.probs
+        return _Grid(self.offset, step, probs)
+
+    def __neg__(self) -> "_Grid":
+        return _Grid(-(self.offset + self.step * (len(self.probs) - 1)), self.step, self.probs[::-1].copy())
+
+    def shift(self, other: int) -> "_Grid":
+        return _Grid(self.offset + other, self.step, self.probs)
+
+    def scale(self, other: int) -> "_Grid":
+        if other == 0:
+            return _Grid(0, 1, np.array([self.probs.sum()]))
+        if other < 0:
+            return (-self).scale(-other)
+        return _Grid(self.offset * other, self.step * other, self.probs)
+
+    def convolve(self, other: "_Grid", exact: bool = False) -> "_Grid | None":
+        """
+        Returns the distribution of the sum or None, if the common grid would be too sparse.
+        Large grids are convolved by FFT, unless ``exact``.
+        """
+        step = gcd(self.step, other.step)
+        size = sum((len(grid.probs) - 1) * (grid.step // step) + 1 for grid in (self, other))
+        if size > _GRID_MAX_FILL * self.count() * other.count():
+            return None
+        a, b = self.regrid(step), other.regrid(step)
+        if exact or len(a.probs) * len(b.probs) <= _DIRECT_CONVOLVE:
+            return _Grid(a.offset + b.offset, step, np.convolve(a.probs, b.probs))
+        # the FFT has an absolute roundoff error relative to the largest probability,
+        # outcomes below it are indistinguishable from noise and removed, their mass is reported
+        probs = fftconvolve(a.probs, b.probs)
+        noise = probs < np.finfo(float).eps * np.log2(len(probs)) * probs.max()
+        truncated = float(probs[noise & (probs > 0)].sum())
+        probs[noise] = 0
+        return _Grid(a.offset + b.offset, step, probs, truncated)
+
+def random_streams(n: int, seed: int | np.random.SeedSequence | None = None) -> list[np.random.Generator]:
+    """Returns ``n`` statistically independent random generators, e.g. one per parallel worker, reproducible by ``seed``."""
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [np.random.default_rng(child) for child in seed.spawn(n)]
+
+class Pruning:
+    """
+    Policy to bound the support of distributions created by binary operations.
+    The steps are applied in the order ``width``, ``epsilon``, ``top``.
+
+    Parameters
+    ----------
+    epsilon : float, optional
+        Drop all outcomes with a probability below ``epsilon``.
+        The default is None.
+    top : int, optional
+        Keep only the ``top`` most probable outcomes.
+        The default is None.
+    width : float, optional
+        Re-bin numeric outcomes onto the grid ``width * round(key / width)``.
+        This does not discard any probability.
+        The default is None.
+    """
+
+    def __init__(self, epsilon: float | None = None, top: int | None = None, width: float | None = None):
+        self.epsilon = epsilon
+        self.top = top
+        self.width = width
+
+    def __repr__(self) -> str:
+        return f"Pruning(epsilon={self.epsilon}, top={self.top}, width={self.width})"
+
+    def apply(self, proba: "Discrete_Probability") -> tuple["Discrete_Probability", float]:
+        """Returns the pruned distribution and the discarded probability."""
+        if self.width is not None:
+            proba = self._rebin(proba)
+        if self.epsilon is None and (self.top is None or len(proba) <= self.top):
+            return proba, 0.
+        total = proba.total
+        if (grid := proba._as_grid()) is not None:
+            probs = grid.probs.copy()
+            if self.epsilon is not None:
+                probs[probs < self.epsilon] = 0
+            if self.top is not None and np.count_nonzero(probs) > self.top:
+                probs[np.argsort(probs, kind="stable")[:len(probs) - self.top]] = 0
+            proba = Discrete_Probability._from_grid(_Grid(grid.offset, grid.step, probs))
+        else:
+            items = proba.items()
+            if self.epsilon is not None:
+                items = [(key, value) for key, value in items if value >= self.epsilon]
+            if self.top is not None and len(items) > self.top:
+                items = nlargest(self.top, items, key=lambda item: item[1])
+            proba = Discrete_Probability(dict(items))
+        return proba, total - proba.total
+
+    def _rebin(self, proba: "Discrete_Probability") -> "Discrete_Probability":
+        arrays = proba._arrays()
+        if arrays is None:
+            raise TypeError("Only numeric distributions can be re-binned.")
+        keys, probs = arrays
+        keys = np.round(keys / self.width) * self.width
+        if isinstance(self.width, (int, np.integer)) and not isinstance(self.width, bool):
+            keys = keys.astype(np.int64)
+        return Discrete_Probability._from_arrays(keys, probs)
+
 class Discrete_Probability(Generic[T]):
-    """A set of discrete probabilities. Mathematical operations leave the total probability unchanged. Bool operations do not."""
+    """
+    A set of discrete probabilities. Mathematical operations leave the total probability unchanged. Bool operations do not.
+    Integer distributions are transparently stored as a dense grid, so that sums and differences are convolutions.
+    These are exact, only very large ones use an FFT, whose roundoff noise floor is removed and added to ``discarded``.
+
+    Set ``pruning`` (on the class or on an instance) to a :class:`Pruning` policy to bound the support of binary operations.
+    The probability removed so far is tracked in ``discarded``.
+
+    Set ``workers`` to a number of processes to split large binary operations on float supports, which have no grid,
+    across a process pool.
+    """
 
-    _distribution: dict[T, float] = {}
+    pruning: Pruning | None = None
+    discarded: float = 0.
+    workers: int | None = None
 
     def __init__(self, distribution: dict[T, float]):
-        self._distribution = distribution
+        self._dist = distribution
+        self._grid = None
+        self._source = None
+        self._index = None
+        self._alias = None
+
+    @staticmethod
+    def _from_grid(grid: _Grid) -> "Discrete_Probability[int]":
+        proba = Discrete_Probability.__new__(Discrete_Probability)
+        proba._dist = None
+        proba._grid = grid
+        proba._source = None
+        proba._index = None
+        proba._alias = None
+        if grid and grid.truncated:
+            proba.discarded = grid.truncated
+        return proba
+
+    @staticmethod
+    def _from_source(keys: np.ndarray, probs: np.ndarray) -> "Discrete_Probability":
+        """Returns a distribution backed by the unique numeric ``keys`` and their ``probs`` (e.g. memory-mapped)."""
+        proba = Discrete_Probability._from_grid(None)
+        proba._source = keys, probs
+        return proba
+
+    @property
+    def _distribution(self) -> dict[T, float]:
+        if self._dist is None:
+            if self._grid:
+                self._dist = self._grid.to_dict()
+            else:
+                keys, probs = self._source
+                self._dist = dict(zip(keys.tolist(), probs.tolist()))
+        return self._dist
+
+    def _as_grid(self) -> _Grid | None:
+        """Returns the dense grid of this distribution, if the support allows one."""
+        if self._grid is None:
+            self._grid = _Grid.from_dict(self._distribution) or False
+        return self._grid or None
+
+    def _propagate(self, result: Self, other: T | Self = None) -> Self:
+        """
+        Passes the pruning policy and discarded probability on to ``result``. Results of binary operations are pruned.
+        The discarded probability is what the unpruned operands would have added to ``result``,
+        i.e. ``result`` scaled by the inverse survival fractions of the operands, so shared history is counted once.
+        """
+        binary = isinstance(other, Discrete_Probability)
+        pruning = self.pruning or (other.pruning if binary else None)
+        discarded = result.discarded # e.g. FFT truncation
+        if lost := [operand for operand in ((self, other) if binary else (self,)) if operand.discarded and operand.total]:
+            discarded += result.total * (prod(1 + operand.discarded / operand.total for operand in lost) - 1)
+        if pruning is not None:
+            if binary:
+                result, dropped = pruning.apply(result)
+                discarded += dropped
+            result.pruning = pruning
+        if discarded:
+            result.discarded = discarded
+        return result
+
+    def _parallel(self, op: Callable, other: Self, reverse: bool = False) -> Self | None:
+        """
+        Returns ``op(self, other)`` (or ``op(other, self)``) computed by ``workers`` processes,
+        or None if not enabled, too small or not a float support.
+        """
+        workers = self.workers or other.workers
+        if not workers or len(self) * len(other) < _PARALLEL_MIN:
+            return None
+        a, b = self._arrays(), other._arrays()
+        if a is None or b is None or "f" not in (a[0].dtype.kind, b[0].dtype.kind):
+            return None
+        divisor = a[0] if reverse else b[0]
+        if op in (operator.truediv, operator.floordiv, operator.mod) and not divisor.all():
+            raise ZeroDivisionError("float division by zero")
+        keys, probs = _parallel_outer(op, a, b, workers, reverse)
+        nonzero = probs != 0
+        return Discrete_Probability._from_source(keys[nonzero], probs[nonzero])
+
+    def prune(self, pruning: Pruning | None = None) -> Self:
+        """Returns this distribution pruned by ``pruning`` or its own policy. The removed probability is added to ``discarded``."""
+        pruning = pruning or self.pruning
+        if pruning is None:
+            return self
+        result, dropped = pruning.apply(self)
+        if result is self: # nothing pruned, attach the policy to a copy
+            result = Discrete_Probability(dict(self._distribution))
+        result.pruning = pruning
+        result.discarded = self.discarded + dropped
+        return result
+
+    def _arrays(self) -> tuple[np.ndarray, np.ndarray] | None:
+        """Returns the support and the probabilities as arrays or None, if the support is not numeric."""
+        if self._source is not None:
+            return self._source
+        if self._grid:
+            grid = self._grid
+            return grid.offset + grid.step * np.arange(len(grid.probs)), grid.probs
+        try:
+            keys = np.array(list(self._distribution))
+        except ValueError: # inhomogeneous keys
+            return None
+        if keys.ndim != 1 or keys.dtype.kind not in "iuf":
+            return None
+        return keys, np.fromiter(self._distribution.values(), dtype=float, count=len(keys))
+
+    @staticmethod
+    def from_samples(samples, weights=None) -> "Discrete_Probability":
+        """
+        Returns the normalized empirical distribution of ``samples`` in one vectorized pass.
+        Integer samples are counted directly onto a grid with ``np.bincount``.
+
+        Parameters
+        ----------
+        samples : array_like
+            Observed outcomes, any shape.
+        weights : array_like, optional
+            Weight of each sample, same shape as ``samples``.
+            The default is None.
+        """
+        samples = np.asarray(samples).ravel()
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float).ravel()
+            if len(weights) != len(samples):
+                raise ValueError(f"Got {len(weights)} weights for {len(samples)} samples.")
+        if len(samples) == 0:
+            return Discrete_Probability({})
+        if samples.dtype.kind in "iu":
+            low, high = int(samples.min()), int(samples.max())
+            if high - low < len(samples):
+                # small signed dtypes would wrap around, unsigned ones cannot go below their minimum
+                offsets = samples - samples.min() if samples.dtype.kind == "u" else samples.astype(np.int64) - low
+                probs = np.bincount(offsets.astype(np.intp), weights=weights, minlength=high - low + 1).astype(float)
+                return Discrete_Probability._from_grid(_Grid(low, 1, probs / probs.sum()))
+        if weights is None:
+            keys, counts = np.unique(samples, return_counts=True)
+            return Discrete_Probability(dict(zip(keys.tolist(), (counts / len(samples)).tolist())))
+        return Discrete_Probability._from_arrays(samples, weights / weights.sum())
+
+    @staticmethod
+    def from_counts(values, counts) -> "Discrete_Probability":
+        """Returns the normalized distribution of a histogram with ``counts`` for each of ``values``. Equal values are summed."""
+        values, counts = np.asarray(values).ravel(), np.asarray(counts, dtype=float).ravel()
+        if len(values) != len(counts):
+            raise ValueError(f"Got {len(counts)} counts for {len(values)} values.")
+        return Discrete_Probability._from_arrays(values, counts / counts.sum())
+
+    @staticmethod
+    def _from_arrays(keys: np.ndarray, probs: np.ndarray) -> "Discrete_Probability":
+        """Returns the distribution of ``keys`` with ``probs``, summing the probabilities of equal keys."""
+        keys, inverse = np.unique(keys, return_inverse=True)
+        probs = np.bincount(inverse.ravel(), weights=probs, minlength=len(keys))
+        nonzero = probs != 0
+        return Discrete_Probability(dict(zip(keys[nonzero].tolist(), probs[nonzero].tolist())))
+
+    def _numeric(self) -> tuple[np.ndarray, np.ndarray]:
+        arrays = self._arrays()
+        if arrays is None:
+            raise TypeError("Vectorized operations need a numeric support.")
+        return arrays
+
+    def _alias_table(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the support, acceptance probabilities and aliases of Vose's alias method. The result is cached."""
+        if self._alias is None:
+            arrays = self._arrays()
+            if arrays is None:
+                keys = np.empty(len(self), dtype=object)
+                keys[:] = list(self._distribution)
+                probs = np.fromiter(self._distribution.values(), dtype=float, count=len(keys))
+            else:
+                keys, probs = arrays
+            n = len(probs)
+            scaled = (probs * (n / probs.sum())).tolist()
+            accept, alias = np.ones(n), np.arange(n)
+            small = [i for i, p in enumerate(scaled) if p < 1]
+            large = [i for i, p in enumerate(scaled) if p >= 1]
+            while small and large:
+                s, l = small.pop(), large[-1]
+                accept[s], alias[s] = scaled[s], l
+                scaled[l] += scaled[s] - 1
+                if scaled[l] < 1:
+                    small.append(large.pop())
+            self._alias = keys, accept, alias
+        return self._alias
+
+    def sample(self, size: int | tuple[int, ...] | None = None, rng: np.random.Generator | int | None = None) -> np.ndarray:
+        """
+        Returns ``size`` random draws from this (normalized) distribution in O(1) per draw.
+
+        Parameters
+        ----------
+        size : int or tuple of int, optional
+            Shape of the returned array. None returns a single draw.
+            The default is None.
+        rng : np.random.Generator or seed, optional
+            Source of randomness, passed to ``np.random.default_rng``.
+            Use :func:`random_streams` for independent parallel workers.
+            The default is None.
+        """
+        keys, accept, alias = self._alias_table()
+        rng = np.random.default_rng(rng)
+        index = rng.integers(len(accept), size=size)
+        return keys[np.where(rng.random(size) < accept[index], index, alias[index])]
+
+    def _cdf_index(self) -> tuple[np.ndarray, np.ndarray] | None:
+        """Returns the sorted support and the cumulative probabilities below each key (starting at 0). The result is cached."""
+        if self._index is None:
+            arrays = self._arrays()
+            if arrays is None:
+                self._index = False
+            else:
+                keys, probs = arrays
+                order = np.argsort(keys, kind="stable")
+                self._index = keys[order], np.concatenate(([0.], np.cumsum(probs[order])))
+        return self._index or None
+
+    def _below(self, other: T | Self, side: str) -> float | None:
+        """
+        Returns the probability of ``self < other`` (``side="left"``) or ``self <= other`` (``side="right"``),
+        using binary search on the cumulative probabilities. None, if the supports are not numeric.
+        """
+        index = self._cdf_index()
+        if index is None:
+            return None
+        keys, cum = index
+        if not isinstance(other, Discrete_Probability):
+            return float(cum[np.searchsorted(keys, other, side)]) if isinstance(other, (int, float, np.number)) else None
+        arrays = other._arrays()
+        if arrays is None:
+            return None
+        other_keys, other_probs = arrays
+        return float(np.dot(other_probs, cum[np.searchsorted(keys, other_keys, side)]))
 
     def __getitem__(self, key: T):
         return self._distribution[key] if key in self._distribution else 0
@@ -27,6 +457,8 @@ class Discrete_Probability(Generic[T]):
         return repr(self._distribution)
     
     def __len__(self) -> int:
+        if self._dist is None and self._source is not None:
+            return len(self._source[0])
         return len(self._distribution)
     
     def __iter__(self) -> Iterator[T]:
@@ -45,16 +477,18 @@ class Discrete_Probability(Generic[T]):
         return item in self._distribution
     
     def __neg__(self) -> Self:
+        if (grid := self._as_grid()) is not None:
+            return self._propagate(Discrete_Probability._from_grid(-grid))
         dist = defaultdict(int)
-        for key, value in self:
+        for key, value in self.items():
             dist[-key] += value
-        return Discrete_Probability(dist)
+        return self._propagate(Discrete_Probability(dist))
     
     def __pos__(self) -> Self:
         dist = defaultdict(int)
         for key, value in self.items():
             dist[+key] += value
-        return Discrete_Probability(dist)
+        return self._propagate(Discrete_Probability(dist))
     
     def __invert__(self) -> Self:
         dist = defaultdict(int)
@@ -63,42 +497,66 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __abs__(self) -> Self:
+        if (arrays := self._arrays()) is not None:
+            keys, probs = arrays
+            return self._propagate(Discrete_Probability._from_arrays(np.abs(keys), probs))
         dist = defaultdict(int)
         for key, value in self.items():
             dist[abs(key)] += value
-        return Discrete_Probability(dist)
+        return self._propagate(Discrete_Probability(dist))
 
     def __round__(self, ndigits:int=0) -> Self:
+        if (arrays := self._arrays()) is not None:
+            keys, probs = arrays
+            return self._propagate(Discrete_Probability._from_arrays(np.round(keys, ndigits), probs))
         dist = defaultdict(int)
         for key, value in self.items():
             dist[round(key, ndigits)] += value
-        return Discrete_Probability(dist)
+        return self._propagate(Discrete_Probability(dist))
     
     def __floor__(self) -> Self:
+        if (arrays := self._arrays()) is not None and (keys := _integral(arrays[0], np.floor)) is not None:
+            return self._propagate(Discrete_Probability._from_arrays(keys, arrays[1]))
         dist = defaultdict(int)
         for key, value in self.items():
             dist[floor(key)] += value
-        return Discrete_Probability(dist)
+        return self._propagate(Discrete_Probability(dist))
     
     def __ceil__(self) -> Self:
+        if (arrays := self._arrays()) is not None and (keys := _integral(arrays[0], np.ceil)) is not None:
+            return self._propagate(Discrete_Probability._from_arrays(keys, arrays[1]))
         dist = defaultdict(int)
         for key, value in self.items():
             dist[ceil(key)] += value
-        return Discrete_Probability(dist)
+        return self._propagate(Discrete_Probability(dist))
+
+    def _convolve(self, other: _Grid | None, negate: bool = False) -> _Grid | None:
+        """Returns the grid of the sum (or difference) with ``other`` or None, if no grid fits."""
+        grid = self._as_grid()
+        if grid is None or other is None:
+            return None
+        return grid.convolve(-other if negate else other)
 
     def __add__(self, other: T | Self) -> Self:
-        return self.__add_self(other) if isinstance(other, Discrete_Probability) else self.__add_T(other)
+        if isinstance(other, Lazy_Probability): return NotImplemented
+        return self._propagate(self.__add_self(other) if isinstance(other, Discrete_Probability) else self.__add_T(other), other)
     
     def __radd__(self, other: T | Self) -> Self:
         return self + other
     
     def __add_T(self, other: T) -> Self:
+        if _is_integer(other) and (grid := self._as_grid()) is not None:
+            return Discrete_Probability._from_grid(grid.shift(int(other)))
         dist = defaultdict(int)
         for key, value in self.items():
             dist[key + other] += value
         return Discrete_Probability(dist)
     
     def __add_self(self, other: Self) -> Self:
+        if (grid := self._convolve(other._as_grid())) is not None:
+            return Discrete_Probability._from_grid(grid)
+        if (result := self._parallel(operator.add, other)) is not None:
+            return result
         dist = defaultdict(int)
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -106,18 +564,25 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
 
     def __sub__(self, other: T | Self) -> Self:
-        return self.__sub_self(other) if isinstance(other, Discrete_Probability) else self.__sub_T(other)
+        if isinstance(other, Lazy_Probability): return NotImplemented
+        return self._propagate(self.__sub_self(other) if isinstance(other, Discrete_Probability) else self.__sub_T(other), other)
     
     def __rsub__(self, other: T | Self) -> Self:
         return -self + other
     
     def __sub_T(self, other: T) -> Self:
+        if _is_integer(other) and (grid := self._as_grid()) is not None:
+            return Discrete_Probability._from_grid(grid.shift(-int(other)))
         dist = defaultdict(int)
         for key, value in self.items():
             dist[key - other] += value
         return Discrete_Probability(dist)
     
     def __sub_self(self, other: Self) -> Self:
+        if (grid := self._convolve(other._as_grid(), negate=True)) is not None:
+            return Discrete_Probability._from_grid(grid)
+        if (result := self._parallel(operator.sub, other)) is not None:
+            return result
         dist = defaultdict(int)
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -125,18 +590,23 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
 
     def __mul__(self, other: T | Self) -> Self:
-        return self.__mul_self(other) if isinstance(other, Discrete_Probability) else self.__mul_T(other)
+        if isinstance(other, Lazy_Probability): return NotImplemented
+        return self._propagate(self.__mul_self(other) if isinstance(other, Discrete_Probability) else self.__mul_T(other), other)
     
     def __rmul__(self, other: T | Self) -> Self:
         return self * other
     
     def __mul_T(self, other: T) -> Self:
+        if _is_integer(other) and (grid := self._as_grid()) is not None:
+            return Discrete_Probability._from_grid(grid.scale(int(other)))
         dist = defaultdict(int)
         for key, value in self.items():
             dist[key * other] += value
         return Discrete_Probability(dist)
     
     def __mul_self(self, other: Self) -> Self:
+        if (result := self._parallel(operator.mul, other)) is not None:
+            return result
         dist = defaultdict(int)
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -144,7 +614,8 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __truediv__(self, other: T | Self) -> Self:
-        return self.__truediv_self(other) if isinstance(other, Discrete_Probability) else self.__truediv_T(other)
+        if isinstance(other, Lazy_Probability): return NotImplemented
+        return self._propagate(self.__truediv_self(other) if isinstance(other, Discrete_Probability) else self.__truediv_T(other), other)
     
     def __truediv_T(self, other: T) -> Self:
         dist = defaultdict(int)
@@ -153,6 +624,8 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __truediv_self(self, other: Self) -> Self:
+        if (result := self._parallel(operator.truediv, other)) is not None:
+            return result
         dist = defaultdict(int)
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -160,7 +633,7 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __rtruediv__(self, other: T | Self) -> Self:
-        return self.__rtruediv_self(other) if isinstance(other, Discrete_Probability) else self.__rtruediv_T(other)
+        return self._propagate(self.__rtruediv_self(other) if isinstance(other, Discrete_Probability) else self.__rtruediv_T(other), other)
     
     def __rtruediv_T(self, other: T) -> Self:
         dist = defaultdict(int)
@@ -169,6 +642,8 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __rtruediv_self(self, other: Self) -> Self:
+        if (result := self._parallel(operator.truediv, other, reverse=True)) is not None:
+            return result
         dist = defaultdict(int)
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -176,7 +651,8 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __floordiv__(self, other: T | Self) -> Self:
-        return self.__floordiv_self(other) if isinstance(other, Discrete_Probability) else self.__floordiv_T(other)
+        if isinstance(other, Lazy_Probability): return NotImplemented
+        return self._propagate(self.__floordiv_self(other) if isinstance(other, Discrete_Probability) else self.__floordiv_T(other), other)
     
     def __floordiv_T(self, other: T) -> Self:
         dist = defaultdict(int)
@@ -185,6 +661,8 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __floordiv_self(self, other: Self) -> Self:
+        if (result := self._parallel(operator.floordiv, other)) is not None:
+            return result
         dist = defaultdict(int)
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -192,7 +670,7 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __rfloordiv__(self, other: T | Self) -> Self:
-        return self.__rfloordiv_self(other) if isinstance(other, Discrete_Probability) else self.__rfloordiv_T(other)
+        return self._propagate(self.__rfloordiv_self(other) if isinstance(other, Discrete_Probability) else self.__rfloordiv_T(other), other)
     
     def __rfloordiv_T(self, other: T) -> Self:
         dist = defaultdict(int)
@@ -201,6 +679,8 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __rfloordiv_self(self, other: Self) -> Self:
+        if (result := self._parallel(operator.floordiv, other, reverse=True)) is not None:
+            return result
         dist = defaultdict(int)
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -208,7 +688,8 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __mod__(self, other: T | Self) -> Self:
-        return self.__mod_self(other) if isinstance(other, Discrete_Probability) else self.__mod_T(other)
+        if isinstance(other, Lazy_Probability): return NotImplemented
+        return self._propagate(self.__mod_self(other) if isinstance(other, Discrete_Probability) else self.__mod_T(other), other)
     
     def __mod_T(self, other: T) -> Self:
         dist = defaultdict(int)
@@ -217,6 +698,8 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __mod_self(self, other: Self) -> Self:
+        if (result := self._parallel(operator.mod, other)) is not None:
+            return result
         dist = defaultdict(int)
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -224,7 +707,7 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __rmod__(self, other: T | Self) -> Self:
-        return self.__rmod_self(other) if isinstance(other, Discrete_Probability) else self.__rmod_T(other)
+        return self._propagate(self.__rmod_self(other) if isinstance(other, Discrete_Probability) else self.__rmod_T(other), other)
     
     def __rmod_T(self, other: T) -> Self:
         dist = defaultdict(int)
@@ -233,6 +716,8 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __rmod_self(self, other: Self) -> Self:
+        if (result := self._parallel(operator.mod, other, reverse=True)) is not None:
+            return result
         dist = defaultdict(int)
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -240,7 +725,8 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __pow__(self, other: T | Self) -> Self:
-        return self.__pow_self(other) if isinstance(other, Discrete_Probability) else self.__pow_T(other)
+        if isinstance(other, Lazy_Probability): return NotImplemented
+        return self._propagate(self.__pow_self(other) if isinstance(other, Discrete_Probability) else self.__pow_T(other), other)
     
     def __pow_T(self, other: T) -> Self:
         dist = defaultdict(int)
@@ -256,7 +742,7 @@ class Discrete_Probability(Generic[T]):
         return Discrete_Probability(dist)
     
     def __rpow__(self, other: T | Self) -> Self:
-        return self.__rpow_self(other) if isinstance(other, Discrete_Probability) else self.__rpow_T(other)
+        return self._propagate(self.__rpow_self(other) if isinstance(other, Discrete_Probability) else self.__rpow_T(other), other)
     
     def __rpow_T(self, other: T) -> Self:
         dist = defaultdict(int)
@@ -284,12 +770,14 @@ class Discrete_Probability(Generic[T]):
         return self.__lt_self(other) if isinstance(other, Discrete_Probability) else self.__lt_T(other)
     
     def __lt_T(self, other: T) -> float:
+        if (p := self._below(other, "left")) is not None: return p
         sumvar = 0
         for key, value in self.items():
             if key < other: sumvar += value
         return sumvar
     
     def __lt_self(self, other: Self) -> float:
+        if (p := self._below(other, "left")) is not None: return p
         sumvar = 0
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -300,12 +788,14 @@ class Discrete_Probability(Generic[T]):
         return self.__le_self(other) if isinstance(other, Discrete_Probability) else self.__le_T(other)
     
     def __le_T(self, other: T) -> float:
+        if (p := self._below(other, "right")) is not None: return p
         sumvar = 0
         for key, value in self.items():
             if key <= other: sumvar += value
         return sumvar
     
     def __le_self(self, other: Self) -> float:
+        if (p := self._below(other, "right")) is not None: return p
         sumvar = 0
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -322,6 +812,7 @@ class Discrete_Probability(Generic[T]):
         return sumvar
     
     def __eq_self(self, other: Self) -> float:
+        if (p := self._below(other, "right")) is not None: return p - self._below(other, "left")
         sumvar = 0
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -338,6 +829,7 @@ class Discrete_Probability(Generic[T]):
         return sumvar
     
     def __ne_self(self, other: Self) -> float:
+        if (p := self._below(other, "right")) is not None: return self.total * other.total - p + self._below(other, "left")
         sumvar = 0
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -348,12 +840,14 @@ class Discrete_Probability(Generic[T]):
         return self.__gt_self(other) if isinstance(other, Discrete_Probability) else self.__gt_T(other)
     
     def __gt_T(self, other: T) -> float:
+        if (p := self._below(other, "right")) is not None: return self.total - p
         sumvar = 0
         for key, value in self.items():
             if key > other: sumvar += value
         return sumvar
     
     def __gt_self(self, other: Self) -> float:
+        if (p := other._below(self, "left")) is not None: return p
         sumvar = 0
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -364,12 +858,14 @@ class Discrete_Probability(Generic[T]):
         return self.__ge_self(other) if isinstance(other, Discrete_Probability) else self.__ge_T(other)
     
     def __ge_T(self, other: T) -> float:
+        if (p := self._below(other, "left")) is not None: return self.total - p
         sumvar = 0
         for key, value in self.items():
             if key >= other: sumvar += value
         return sumvar
     
     def __ge_self(self, other: Self) -> float:
+        if (p := other._below(self, "right")) is not None: return p
         sumvar = 0
         for key1, value1 in self.items():
             for key2, value2 in other.items():
@@ -393,17 +889,580 @@ class Discrete_Probability(Generic[T]):
         m = self.mean
         return sum(abs(key - m)**2 * value for key, value in self.items()) / self.total
     
-    def map(self, func: Callable[[T], T]) -> Self:
+    def map(self, func: Callable[[T], T], vectorized: bool = False) -> Self:
+        """
+        Returns the distribution of ``func(key)``, summing the probabilities of equal results.
+        If ``vectorized``, ``func`` is called once with the numeric support as ``np.ndarray``.
+        """
+        if vectorized:
+            keys, probs = self._numeric()
+            return self._propagate(Discrete_Probability._from_arrays(func(keys), probs))
         dist = defaultdict(int)
         for key, value in self.items():
             dist[func(key)] += value
-        return Discrete_Probability(dist)
+        return self._propagate(Discrete_Probability(dist))
 
-    def filter(self, func: Callable[[T], bool]) -> Self:
+    def filter(self, func: Callable[[T], bool], vectorized: bool = False) -> Self:
+        """
+        Returns the distribution restricted to the keys where ``func(key)`` is true.
+        If ``vectorized``, ``func`` is called once with the numeric support as ``np.ndarray`` and returns a mask.
+        """
+        if vectorized:
+            keys, probs = self._numeric()
+            mask = np.asarray(func(keys), dtype=bool)
+            return self._propagate(Discrete_Probability._from_arrays(keys[mask], probs[mask]))
         dist = defaultdict(int)
         for key, value in self.items():
             if func(key): dist[key] += value
-        return Discrete_Probability(dist)
+        return self._propagate(Discrete_Probability(dist))
+
+    def _repeat(self, n: int, op: Callable[[Self, Self], Self]) -> Self:
+        """Combines ``n`` independent copies with ``op`` by binary doubling."""
+        if n < 1:
+            raise ValueError(f"Cannot repeat a distribution {n} times.")
+        result, power = None, self
+        while True:
+            if n & 1:
+                result = power if result is None else op(result, power)
+            n >>= 1
+            if n == 0:
+                return result
+            power = op(power, power)
+
+    def repeat_sum(self, n: int) -> Self:
+        """
+        Returns the sum of ``n`` independent copies, using about ``2 log2(n)`` additions.
+        Integer grids are always convolved exactly, so the tails match ``n - 1`` chained additions,
+        which would cost more than the exact squarings.
+        """
+        return self._repeat(n, _exact_sum)
+
+    def repeat_mul(self, n: int) -> Self:
+        """Returns the product of ``n`` independent copies, using about ``2 log2(n)`` multiplications."""
+        return self._repeat(n, lambda a, b: a * b)
+
+    def save(self, path: str) -> str:
+        """
+        Saves this numeric distribution as uncompressed ``.npz`` file, which :meth:`load` memory-maps.
+        Integer distributions are stored as grid, others as arrays of keys and probabilities.
+        Returns the path of the file.
+        """
+        if not path.endswith(".npz"):
+            path += ".npz"
+        grid = self._grid or (self._as_grid() if self._source is None else None)
+        if grid is not None:
+            arrays = {"grid": np.array([grid.offset, grid.step]), "probs": grid.probs}
+        else:
+            keys, probs = self._numeric()
+            arrays = {"keys": keys, "probs": probs}
+        io.mkdirs(path)
+        with open(path + ".tmp", "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(path + ".tmp", path)
+        return path
+
+    @staticmethod
+    def load(path: str) -> "Discrete_Probability":
+        """Returns the distribution stored by :meth:`save`. The arrays are memory-mapped instead of read."""
+        arrays = _load_npz(path)
+        if "grid" in arrays:
+            offset, step = arrays["grid"].tolist()
+            return Discrete_Probability._from_grid(_Grid(offset, step, arrays["probs"]))
+        return Discrete_Probability._from_source(arrays["keys"], arrays["probs"])
+
+    def freeze(self) -> "Frozen_Probability[T]":
+        """Returns an immutable copy of this distribution, see :class:`Frozen_Probability`."""
+        return Frozen_Probability._freeze(self)
+
+    def lazy(self) -> "Lazy_Probability[T]":
+        """Returns a lazy view on this distribution, see :class:`Lazy_Probability`."""
+        return Lazy_Probability(self)
+
+class Frozen_Probability(Discrete_Probability[T]):
+    """
+    An immutable distribution. The support is frozen on construction and
+    ``total``, ``mean``, ``variance`` and the content hash are computed once on first access.
+    Binary operations return frozen results, which are memoized in a bounded LRU cache keyed by the content hashes,
+    holding at most ``memo_size`` results.
+    """
+    memo_size: int = 256
+
+    # lazily computed caches, which may only be filled once after freezing
+    _caches = frozenset(("_digest", "_total", "_mean", "_variance", "_grid", "_index", "_alias"))
+
+    def __init__(self, distribution: dict[T, float]):
+        super().__init__(MappingProxyType(dict(distribution)))
+        self._digest = self._total = self._mean = self._variance = None
+        self._frozen = True
+
+    def __setattr__(self, name: str, value) -> None:
+        if getattr(self, "_frozen", False) and not (name in self._caches and getattr(self, name) is None):
+            raise AttributeError(f"Cannot set {name!r}, {type(self).__name__} is immutable.")
+        super().__setattr__(name, value)
+
+    @staticmethod
+    def _freeze(proba: Discrete_Probability[T]) -> "Frozen_Probability[T]":
+        if isinstance(proba, Frozen_Probability):
+            return proba
+        frozen = Frozen_Probability.__new__(Frozen_Probability)
+        grid = proba._as_grid()
+        if grid is not None: # lock a copy, the grid of proba stays writeable
+            grid = _Grid(grid.offset, grid.step, grid.probs.copy(), grid.truncated)
+            grid.probs.flags.writeable = False
+            Discrete_Probability.__init__(frozen, None)
+            frozen._grid = grid
+        else:
+            Discrete_Probability.__init__(frozen, MappingProxyType(dict(proba._distribution)))
+        frozen._digest = frozen._total = frozen._mean = frozen._variance = None
+        if proba.pruning is not Discrete_Probability.pruning: frozen.pruning = proba.pruning
+        if proba.discarded: frozen.discarded = proba.discarded
+        frozen._frozen = True
+        return frozen
+
+    @property
+    def _distribution(self) -> dict[T, float]:
+        if self._dist is None: # frozen from a grid
+            object.__setattr__(self, "_dist", MappingProxyType(self._grid.to_dict()))
+        return self._dist
+
+    def freeze(self) -> Self:
+        return self
+
+    @property
+    def digest(self) -> str:
+        """Stable content hash of the support and probabilities (ignoring outcomes of probability 0)."""
+        if self._digest is None:
+            h = blake2b(digest_size=16)
+            arrays = self._arrays()
+            if arrays is not None:
+                keys, probs = arrays
+                nonzero = probs != 0
+                keys, probs = keys[nonzero], probs[nonzero]
+                order = np.argsort(keys, kind="stable")
+                h.update(keys.dtype.str.encode())
+                h.update(np.ascontiguousarray(keys[order]).tobytes())
+                h.update(np.ascontiguousarray(probs[order], dtype=float).tobytes())
+            else:
+                for key, value in sorted((repr(key), value) for key, value in self.items() if value != 0):
+                    h.update(key.encode())
+                    h.update(np.float64(value).tobytes())
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def __hash__(self) -> int:
+        return int(self.digest[:16], 16)
+
+    @property
+    def total(self):
+        if self._total is None:
+            self._total = super().total
+        return self._total
+
+    @property
+    def mean(self) -> T:
+        if self._mean is None:
+            self._mean = super().mean
+        return self._mean
+
+    @property
+    def variance(self) -> T:
+        if self._variance is None:
+            self._variance = super().variance
+        return self._variance
+
+    def _memoized(self, name: str, other: T | Discrete_Probability) -> Self:
+        """
+        Evaluates the binary operation ``name`` of :class:`Discrete_Probability` through the LRU cache.
+        The key includes the pruning policies and discarded probabilities, which change the result.
+        Unhashable operands are evaluated uncached.
+        """
+        state = (_pruning_key(self.pruning), self.discarded)
+        if isinstance(other, Frozen_Probability):
+            key = (name, self.digest, other.digest, state, _pruning_key(other.pruning), other.discarded)
+        elif isinstance(other, Discrete_Probability):
+            key = None
+        else:
+            key = (name, self.digest, state, type(other), other)
+        try:
+            cached = key is not None and key in _memo
+        except TypeError: # unhashable operand like an array
+            key, cached = None, False
+        if cached:
+            _memo.move_to_end(key)
+            return _memo[key]
+        result = getattr(Discrete_Probability, name)(self, other)
+        if result is NotImplemented:
+            return result
+        result = Frozen_Probability._freeze(result)
+        if key is not None and self.memo_size > 0:
+            _memo[key] = result
+            while len(_memo) > self.memo_size:
+                _memo.popitem(last=False)
+        return result
+
+    def __add__(self, other: T | Discrete_Probability) -> Self:
+        return self._memoized("__add__", other)
+
+    def __radd__(self, other: T | Discrete_Probability) -> Self:
+        return self._memoized("__radd__", other)
+
+    def __sub__(self, other: T | Discrete_Probability) -> Self:
+        return self._memoized("__sub__", other)
+
+    def __rsub__(self, other: T | Discrete_Probability) -> Self:
+        return self._memoized("__rsub__", other)
+
+    def __mul__(self, other: T | Discrete_Probability) -> Self:
+        return self._memoized("__mul__", other)
+
+    def __rmul__(self, other: T | Discrete_Probability) -> Self:
+        return self._memoized("__rmul__", other)
+
+    def __truediv__(self, other: T | Discrete_Probability) -> Self:
+        return self._memoized("__truediv__", other)
+
+    def __rtruediv__(self, other: T | Discrete_Probability) -> Self:
+        return self._memoized("__rtruediv__", other)
+
+    def __floordiv__(self, other: T | Discrete_Probability) -> Self:
+        return self._memoized("__floordiv__", other)
+
+    def __rfloordiv__(self, other: T | Discrete_Probability) -> Self:
+        return self._memoized("__rfloordiv__", other)
+
+    def __mod__(self, other: T | Discrete_Probability) -> Self:
+        return self._memoized("__mod__", other)
+
+    def __rmod__(self, other: T | Discrete_Probability) -> Self:
+        return self._memoized("__rmod__", other)
+
+    def __pow__(self, other: T | Discrete_Probability) -> Self:
+        return self._memoized("__pow__", other)
+
+    def __rpow__(self, other: T | Discrete_Probability) -> Self:
+        return self._memoized("__rpow__", other)
+
+_memo: OrderedDict[tuple, Frozen_Probability] = OrderedDict()
+
+def _pruning_key(pruning: Pruning | None) -> tuple | None:
+    """Returns the settings of ``pruning`` as part of a memo key, so equal policies share cached results."""
+    return None if pruning is None else (pruning.epsilon, pruning.top, pruning.width)
+
+class Lazy_Probability(Discrete_Probability[T]):
+    """
+    A distribution which records operations as an expression graph and evaluates it on first access.
+    Chains of element-wise operations (``map``, ``filter``, operations with a constant, ...) are fused into a single pass.
+    Subexpressions used more than once are evaluated only once.
+    """
+
+    def __init__(self, value: Discrete_Probability[T] | None = None, parent: Self | None = None, step: tuple | None = None,
+                 op: Callable | None = None, operands: tuple | None = None):
+        self._value = value.evaluate() if isinstance(value, Lazy_Probability) else value
+        self._parent = parent
+        self._step = step # (is_filter, func, vectorized)
+        self._op = op
+        self._operands = operands
+        self._children = 0
+        for node in (parent,) if parent is not None else operands or ():
+            node._children += 1
+
+    @property
+    def _distribution(self) -> dict[T, float]:
+        return self.evaluate()._distribution
+
+    def _as_grid(self) -> _Grid | None:
+        return self.evaluate()._as_grid()
+
+    def _arrays(self) -> tuple[np.ndarray, np.ndarray] | None:
+        return self.evaluate()._arrays()
+
+    @property
+    def discarded(self) -> float:
+        return self.evaluate().discarded
+
+    def _cdf_index(self) -> tuple[np.ndarray, np.ndarray] | None:
+        return self.evaluate()._cdf_index()
+
+    def _alias_table(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return self.evaluate()._alias_table()
+
+    def __len__(self) -> int:
+        return len(self.evaluate())
+
+    def save(self, path: str) -> str:
+        return self.evaluate().save(path)
+
+    def lazy(self) -> Self:
+        return self
+
+    def _chain(self, step: tuple) -> Self:
+        return Lazy_Probability(parent=self, step=step)
+
+    def _binary(self, op: Callable, other: T | Discrete_Probability, reverse: bool = False) -> Self:
+        if not isinstance(other, Discrete_Probability):
+            return self._chain((False, (lambda key: op(other, key)) if reverse else (lambda key: op(key, other)), False))
+        other = other.lazy()
+        return Lazy_Probability(op=op, operands=(other, self) if reverse else (self, other))
+
+    def _fused(self) -> tuple[Self, list[tuple]]:
+        """Returns the node to start from and the element-wise steps which follow it."""
+        steps, node = [], self
+        while node._value is None and node._step is not None:
+            steps.append(node._step)
+            node = node._parent
+            if node._children > 1: break
+        return node, steps[::-1]
+
+    def _inputs(self) -> tuple[Self, ...]:
+        """Returns the nodes which have to be evaluated before this one."""
+        return self._operands if self._op is not None else (self._fused()[0],)
+
+    def evaluate(self) -> Discrete_Probability[T]:
+        """
+        Returns the evaluated distribution. The result is cached.
+        The graph is walked in post-order with an explicit stack, so long chains do not hit the recursion limit.
+        """
+        stack = [self]
+        while stack:
+            node = stack[-1]
+            if node._value is not None:
+                stack.pop()
+                continue
+            pending = [child for child in node._inputs() if child._value is None]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            if node._op is not None:
+                left, right = (operand._value for operand in node._operands)
+                node._value = node._op(left, right)
+            else:
+                start, steps = node._fused()
+                value = start._value
+                for vectorized, run in groupby(steps, key=lambda step: step[2]):
+                    value = _apply_vectorized(value, list(run)) if vectorized else _apply(value, list(run))
+                node._value = value
+            node._parent = node._operands = None
+        return self._value
+
+    def map(self, func: Callable[[T], T], vectorized: bool = False) -> Self:
+        return self._chain((False, func, vectorized))
+
+    def filter(self, func: Callable[[T], bool], vectorized: bool = False) -> Self:
+        return self._chain((True, func, vectorized))
+
+    def __neg__(self) -> Self:
+        return self._chain((False, operator.neg, False))
+
+    def __pos__(self) -> Self:
+        return self._chain((False, operator.pos, False))
+
+    def __abs__(self) -> Self:
+        return self._chain((False, abs, False))
+
+    def __round__(self, ndigits: int = 0) -> Self:
+        return self._chain((False, lambda key: round(key, ndigits), False))
+
+    def __floor__(self) -> Self:
+        return self._chain((False, floor, False))
+
+    def __ceil__(self) -> Self:
+        return self._chain((False, ceil, False))
+
+    def __add__(self, other: T | Discrete_Probability) -> Self:
+        return self._binary(operator.add, other)
+
+    def __radd__(self, other: T | Discrete_Probability) -> Self:
+        return self._binary(operator.add, other, reverse=True)
+
+    def __sub__(self, other: T | Discrete_Probability) -> Self:
+        return self._binary(operator.sub, other)
+
+    def __rsub__(self, other: T | Discrete_Probability) -> Self:
+        return self._binary(operator.sub, other, reverse=True)
+
+    def __mul__(self, other: T | Discrete_Probability) -> Self:
+        return self._binary(operator.mul, other)
+
+    def __rmul__(self, other: T | Discrete_Probability) -> Self:
+        return self._binary(operator.mul, other, reverse=True)
+
+    def __truediv__(self, other: T | Discrete_Probability) -> Self:
+        return self._binary(operator.truediv, other)
+
+    def __rtruediv__(self, other: T | Discrete_Probability) -> Self:
+        return self._binary(operator.truediv, other, reverse=True)
+
+    def __floordiv__(self, other: T | Discrete_Probability) -> Self:
+        return self._binary(operator.floordiv, other)
+
+    def __rfloordiv__(self, other: T | Discrete_Probability) -> Self:
+        return self._binary(operator.floordiv, other, reverse=True)
+
+    def __mod__(self, other: T | Discrete_Probability) -> Self:
+        return self._binary(operator.mod, other)
+
+    def __rmod__(self, other: T | Discrete_Probability) -> Self:
+        return self._binary(operator.mod, other, reverse=True)
+
+    def __pow__(self, other: T | Discrete_Probability) -> Self:
+        return self._binary(operator.pow, other)
+
+    def __rpow__(self, other: T | Discrete_Probability) -> Self:
+        return self._binary(operator.pow, other, reverse=True)
+
+def _exact_sum(a: Discrete_Probability, b: Discrete_Probability) -> Discrete_Probability:
+    """Returns ``a + b``, convolving integer grids exactly regardless of their size."""
+    if not isinstance(a, Lazy_Probability) and (grid := a._as_grid()) is not None and (other := b._as_grid()) is not None \
+            and (result := grid.convolve(other, exact=True)) is not None:
+        result = a._propagate(Discrete_Probability._from_grid(result), b)
+        return Frozen_Probability._freeze(result) if isinstance(a, Frozen_Probability) else result
+    return a + b
+
+def _apply(proba: Discrete_Probability, steps: list[tuple]) -> Discrete_Probability:
+    """Passes all keys through the element-wise ``steps`` in a single loop."""
+    dist = defaultdict(int)
+    for key, value in proba.items():
+        for is_filter, func, _ in steps:
+            if is_filter:
+                if not func(key): break
+            else:
+                key = func(key)
+        else:
+            dist[key] += value
+    return proba._propagate(Discrete_Probability(dist))
+
+def _apply_vectorized(proba: Discrete_Probability, steps: list[tuple]) -> Discrete_Probability:
+    """Passes the whole support array through the vectorized ``steps``, aggregating equal keys once at the end."""
+    keys, probs = proba._numeric()
+    for is_filter, func, _ in steps:
+        if is_filter:
+            mask = np.asarray(func(keys), dtype=bool)
+            keys, probs = keys[mask], probs[mask]
+        else:
+            keys = func(keys)
+    return proba._propagate(Discrete_Probability._from_arrays(keys, probs))
+
+def _parallel_outer(op: Callable, a: tuple[np.ndarray, np.ndarray], b: tuple[np.ndarray, np.ndarray],
+                    workers: int, reverse: bool) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the unique keys and the summed probabilities of ``op`` over all pairs of ``a`` and ``b``.
+    The arrays are shared with the worker processes, each reduces a chunk of rows of ``a`` with ``np.unique``.
+    The rows are split evenly over the workers (more tasks only to bound their memory),
+    and the partial results are merged as arrays by one more ``np.unique``.
+    """
+    arrays = [np.ascontiguousarray(array) for array in (*a, *b)]
+    shm = SharedMemory(create=True, size=sum(array.nbytes for array in arrays))
+    try:
+        layout, offset = [], 0
+        for array in arrays:
+            np.ndarray(array.shape, array.dtype, shm.buf, offset)[:] = array
+            layout.append((array.shape, array.dtype.str, offset))
+            offset += array.nbytes
+        tasks = max(workers, -(-len(arrays[0]) * len(arrays[2]) // _PARALLEL_CHUNK[1]))
+        rows = max(-(-len(arrays[0]) // tasks), -(-_PARALLEL_CHUNK[0] // len(arrays[2])))
+        with ProcessPoolExecutor(workers) as pool:
+            parts = list(pool.map(_outer_chunk, *zip(*[(shm.name, layout, op, start, start + rows, reverse)
+                                                        for start in range(0, len(arrays[0]), rows)])))
+    finally:
+        shm.close()
+        shm.unlink()
+    keys, inverse = np.unique(np.concatenate([part[0] for part in parts]), return_inverse=True)
+    return keys, np.bincount(inverse.ravel(), weights=np.concatenate([part[1] for part in parts]), minlength=len(keys))
+
+def _outer_chunk(name: str, layout: list[tuple], op: Callable, start: int, stop: int, reverse: bool) -> tuple[np.ndarray, np.ndarray]:
+    """Worker of :func:`_parallel_outer`, aggregating the rows ``start:stop``."""
+    shm = SharedMemory(name=name)
+    try:
+        keys_a, probs_a, keys_b, probs_b = (np.ndarray(shape, dtype, shm.buf, offset) for shape, dtype, offset in layout)
+        keys_a, probs_a = keys_a[start:stop, None], probs_a[start:stop, None]
+        keys = op(keys_b, keys_a) if reverse else op(keys_a, keys_b)
+        keys, inverse = np.unique(keys, return_inverse=True)
+        result = keys, np.bincount(inverse.ravel(), weights=(probs_a * probs_b).ravel(), minlength=len(keys))
+        del keys_a, probs_a, keys_b, probs_b # release the views before closing
+    finally:
+        shm.close()
+    return result
+
+def _load_npz(path: str) -> dict[str, np.ndarray]:
+    """Memory-maps the arrays of an uncompressed ``.npz`` file. Compressed members are read."""
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as file:
+        for info in archive.infolist():
+            name = info.filename.removesuffix(".npy")
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+            file.seek(info.header_offset + 26) # skip the fixed part of the local file header
+            name_length, extra_length = struct.unpack("<HH", file.read(4))
+            file.seek(name_length + extra_length, os.SEEK_CUR)
+            version = np.lib.format.read_magic(file)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(file)
+            if dtype.hasobject or prod(shape) == 0:
+                file.seek(info.header_offset)
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=file.tell(), shape=shape,
+                                     order="F" if fortran_order else "C")
+    return arrays
+
+def _recipe(value) -> str:
+    """
+    Returns a stable description of a cache key argument.
+    Distributions and arrays are described by their content hash, since NumPy truncates the ``repr`` of large arrays.
+    Raises TypeError for arguments without a stable identity, like lambdas or objects whose ``repr`` is an address.
+    """
+    if isinstance(value, Discrete_Probability):
+        return f"<{value.freeze().digest}>"
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return f"<ndarray {value.shape} " + _recipe(value.ravel().tolist()) + ">"
+        h = blake2b(np.ascontiguousarray(value).tobytes(), digest_size=16)
+        return f"<ndarray {value.dtype.str} {value.shape} {h.hexdigest()}>"
+    if isinstance(value, (tuple, list)):
+        return "(" + ",".join(_recipe(v) for v in value) + ")"
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{_recipe(k)}:{_recipe(v)}" for k, v in value.items()) + "}"
+    if isinstance(value, (set, frozenset)): # iteration order depends on the hash seed
+        return "{" + ",".join(sorted(_recipe(v) for v in value)) + "}"
+    if isinstance(value, (type, FunctionType, BuiltinFunctionType)) and "<" not in value.__qualname__:
+        return f"<{value.__module__}.{value.__qualname__}>"
+    text = repr(value)
+    if re.search(r" at 0x[0-9a-fA-F]+", text):
+        raise TypeError(f"Cannot derive a stable cache key from {text}.")
+    return text
+
+def disk_cache(directory: str):
+    """
+    Decorator to cache the distribution returned by a function in ``directory``, see :meth:`Discrete_Probability.save`.
+    The cache key is the function name and a stable description of its bound arguments (``repr``, or the content hash
+    of arrays and distributions), so later calls with the same recipe memory-map the stored result instead of recomputing it.
+
+    Examples
+    ========
+
+    >>> @disk_cache("cache")
+    ... def pool(n, sides):
+    ...     return Die(sides).repeat_sum(n)
+    """
+    def decorator(func):
+        @wraps(func)
+        def cached(*args, **kwargs):
+            arguments = signature(func).bind(*args, **kwargs)
+            arguments.apply_defaults()
+            recipe = _recipe((func.__module__, func.__qualname__, list(arguments.arguments.items())))
+            key = blake2b(recipe.encode(), digest_size=16).hexdigest()
+            path = os.path.join(directory, f"{func.__name__}-{key}.npz")
+            if os.path.exists(path):
+                return Discrete_Probability.load(path)
+            result = func(*args, **kwargs)
+            result.save(path)
+            return result
+        return cached
+    return decorator
 
 class Die(Discrete_Probability[float]):
     """A die with homogenous probabilities for n sides."""
@@ -420,16 +1479,356 @@ class Dice(Discrete_Probability[tuple[float]]):
         distribution = { s: prob for s in product(range(1,sides+1), repeat = n) }
         super().__init__(distribution)
 
+def _keep_counts(n: int, k: int, sides: int, lowest: bool, combine: Callable, empty) -> dict:
+    """
+    Counts the outcomes of the ``k`` highest (or lowest) of ``n`` dice, without enumerating all ``sides**n`` rolls.
+    Faces are assigned from the most to the least preferred one, tracking how many dice are placed and what is kept.
+    Once ``k`` dice are kept, the remaining dice may show any less preferred face.
+    """
+    if not 0 <= k <= n:
+        raise ValueError(f"Cannot keep {k} of {n} dice.")
+    faces = range(1, sides + 1) if lowest else range(sides, 0, -1)
+    counts = defaultdict(int)
+    states = {(0, empty): 1} if k > 0 else {}
+    if k == 0: counts[empty] = sides**n
+    for i, face in enumerate(faces):
+        left = sides - i - 1 # less preferred faces
+        new_states = defaultdict(int)
+        for (placed, kept), count in states.items():
+            for c in range(n - placed + 1):
+                weight = count * comb(n - placed, c)
+                if placed + c < k:
+                    new_states[placed + c, combine(kept, face, c)] += weight
+                else:
+                    counts[combine(kept, face, k - placed)] += weight * left**(n - placed - c)
+        states = new_states
+    return counts
+
+class Dice_Keep(Discrete_Probability[tuple[int]]):
+    """The sorted ``k`` highest (or lowest) of ``n`` dice."""
+
+    def __init__(self, n, k, sides=6, lowest=False):
+        if lowest:
+            combine = lambda kept, face, c: kept + (face,) * c
+        else:
+            combine = lambda kept, face, c: (face,) * c + kept
+        total = sides**n
+        distribution = { key: count / total for key, count in _keep_counts(n, k, sides, lowest, combine, ()).items() }
+        super().__init__(distribution)
+
+class Dice_Keep_Sum(Discrete_Probability[int]):
+    """The sum of the ``k`` highest (or lowest) of ``n`` dice."""
+
+    def __init__(self, n, k, sides=6, lowest=False):
+        combine = lambda kept, face, c: kept + face * c
+        total = sides**n
+        distribution = { key: count / total for key, count in _keep_counts(n, k, sides, lowest, combine, 0).items() }
+        super().__init__(distribution)
+
+
+class _Factor:
+    """
+    Probabilities of the components ``axes`` over their ``supports``,
+    stored either as dense ``tensor`` or as sparse coordinates ``coords`` (COO) with ``probs``.
+    """
+    __slots__ = ("axes", "supports", "tensor", "coords", "probs")
+
+    def __init__(self, axes: tuple[int, ...], supports: list[np.ndarray], tensor: np.ndarray | None = None,
+                 coords: np.ndarray | None = None, probs: np.ndarray | None = None):
+        self.axes = axes
+        self.supports = supports
+        self.tensor = tensor
+        self.coords = coords
+        self.probs = probs
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return tuple(len(support) for support in self.supports)
+
+    def total(self) -> float:
+        return float(self.tensor.sum() if self.tensor is not None else self.probs.sum())
+
+    def points(self) -> tuple[list[np.ndarray], np.ndarray]:
+        """Returns the keys of all stored points for each axis and their probabilities."""
+        if self.tensor is not None:
+            keys = np.meshgrid(*self.supports, indexing="ij")
+            return [key.ravel() for key in keys], self.tensor.ravel()
+        return [support[coords] for support, coords in zip(self.supports, self.coords)], self.probs
+
+    def dense(self) -> np.ndarray:
+        if self.tensor is not None:
+            return self.tensor
+        tensor = np.zeros(self.shape)
+        np.add.at(tensor, tuple(self.coords), self.probs)
+        return tensor
+
+    def marginal(self, keep: list[int]) -> "_Factor":
+        """Returns the factor of the axes at the positions ``keep``."""
+        axes = tuple(self.axes[i] for i in keep)
+        supports = [self.supports[i] for i in keep]
+        if self.tensor is not None:
+            tensor = self.tensor.sum(axis=tuple(i for i in range(len(self.axes)) if i not in keep))
+            return _Factor(axes, supports, tensor=np.transpose(tensor, np.argsort(np.argsort(keep))))
+        shape = tuple(len(support) for support in supports)
+        flat, inverse = np.unique(np.ravel_multi_index(tuple(self.coords[keep]), shape), return_inverse=True)
+        probs = np.bincount(inverse.ravel(), weights=self.probs, minlength=len(flat))
+        return _Factor(axes, supports, coords=np.array(np.unravel_index(flat, shape)).reshape(len(keep), -1), probs=probs)
+
+    def condition(self, position: int, index: int) -> "_Factor":
+        """Returns the (unnormalized) slice at ``index`` of the axis at ``position``."""
+        axes = self.axes[:position] + self.axes[position + 1:]
+        supports = self.supports[:position] + self.supports[position + 1:]
+        if self.tensor is not None:
+            return _Factor(axes, supports, tensor=np.take(self.tensor, index, axis=position))
+        mask = self.coords[position] == index
+        return _Factor(axes, supports, coords=np.delete(self.coords[:, mask], position, axis=0), probs=self.probs[mask])
+
+    def scaled(self, factor: float) -> "_Factor":
+        if self.tensor is not None:
+            return _Factor(self.axes, self.supports, tensor=self.tensor * factor)
+        return _Factor(self.axes, self.supports, coords=self.coords, probs=self.probs * factor)
+
+    def renumbered(self, mapping: dict[int, int]) -> "_Factor":
+        return _Factor(tuple(mapping[axis] for axis in self.axes), self.supports, self.tensor, self.coords, self.probs)
+
+class Joint_Probability:
+    """
+    A joint distribution of several numeric components, stored as probability tensors instead of tuple keys.
+    Independent components are kept in separate factors and only combined on demand,
+    so marginals and reductions of ``n`` independent dice never build the ``sides**n`` tensor.
+    Factors with a sparse support are stored as coordinates (COO).
+    """
+
+    def __init__(self, factors: list[_Factor]):
+        self._factors = factors
+
+    @staticmethod
+    def independent(*distributions: Discrete_Probability) -> "Joint_Probability":
+        """Returns the joint distribution of independent numeric ``distributions``."""
+        factors = []
+        for axis, proba in enumerate(distributions):
+            keys, probs = proba._numeric()
+            factors.append(_Factor((axis,), [keys], tensor=probs))
+        return Joint_Probability(factors)
+
+    @staticmethod
+    def dice(n: int, sides: int = 6) -> "Joint_Probability":
+        """The joint distribution of ``n`` independent dice, see :class:`Dice`."""
+        return Joint_Probability.independent(*[Die(sides)] * n)
+
+    @staticmethod
+    def from_tensor(tensor, *supports) -> "Joint_Probability":
+        """Returns the joint distribution with ``tensor[i, j, ...]`` the probability of ``(supports[0][i], supports[1][j], ...)``."""
+        tensor = np.asarray(tensor, dtype=float)
+        supports = [np.asarray(support) for support in supports]
+        assert tensor.shape == tuple(len(support) for support in supports)
+        return Joint_Probability([_Factor(tuple(range(tensor.ndim)), supports, tensor=tensor)])
+
+    @staticmethod
+    def from_probability(proba: Discrete_Probability[tuple]) -> "Joint_Probability":
+        """Returns the joint distribution of a distribution with numeric tuple keys, e.g. :class:`Dice`."""
+        keys = np.array(list(proba._distribution))
+        probs = np.fromiter(proba._distribution.values(), dtype=float, count=len(keys))
+        supports, coords = zip(*(np.unique(column, return_inverse=True) for column in keys.T))
+        coords = np.array([c.ravel() for c in coords])
+        factor = _Factor(tuple(range(len(supports))), list(supports), coords=coords, probs=probs)
+        if prod(factor.shape) <= _GRID_MAX_FILL * len(probs):
+            factor = _Factor(factor.axes, factor.supports, tensor=factor.dense())
+        return Joint_Probability([factor])
+
+    def __repr__(self) -> str:
+        return f"Joint_Probability({self.ndim} components in {len(self._factors)} factors)"
+
+    @property
+    def ndim(self) -> int:
+        return sum(len(factor.axes) for factor in self._factors)
+
+    @property
+    def supports(self) -> list[np.ndarray]:
+        supports = {}
+        for factor in self._factors:
+            supports.update(zip(factor.axes, factor.supports))
+        return [supports[axis] for axis in range(self.ndim)]
+
+    def _find(self, axis: int) -> tuple[int, int]:
+        """Returns the index of the factor holding ``axis`` and the position within it."""
+        for i, factor in enumerate(self._factors):
+            if axis in factor.axes:
+                return i, factor.axes.index(axis)
+        raise IndexError(f"Axis {axis} out of range for {self.ndim} components.")
+
+    @property
+    def tensor(self) -> np.ndarray:
+        """The full probability tensor. This combines all factors and needs memory of the product of all support sizes."""
+        tensor, order = np.ones(()), []
+        for factor in self._factors:
+            tensor = np.multiply.outer(tensor, factor.dense())
+            order += factor.axes
+        return np.transpose(tensor, np.argsort(order))
+
+    def to_probability(self) -> Discrete_Probability[tuple]:
+        """Returns the distribution with tuple keys, like :class:`Dice`."""
+        tensor = self.tensor
+        return Discrete_Probability({key: value for key, value in zip(product(*(s.tolist() for s in self.supports)), tensor.ravel().tolist()) if value != 0})
+
+    def marginal(self, axis: int | tuple[int, ...]) -> "Discrete_Probability | Joint_Probability":
+        """Returns the distribution of component ``axis``, or the joint distribution of the components in ``axis`` in that order."""
+        if isinstance(axis, (int, np.integer)):
+            return self._marginal1(int(axis))
+        keep = {}
+        for a in axis:
+            i, position = self._find(a)
+            keep.setdefault(i, []).append(position)
+        weight = prod(factor.total() for i, factor in enumerate(self._factors) if i not in keep)
+        factors = [self._factors[i].marginal(positions) for i, positions in keep.items()]
+        factors[0] = factors[0].scaled(weight)
+        mapping = {a: new for new, a in enumerate(axis)}
+        return Joint_Probability([factor.renumbered(mapping) for factor in factors])
+
+    def _marginal1(self, axis: int) -> Discrete_Probability:
+        i, position = self._find(axis)
+        factor = self._factors[i].marginal([position])
+        weight = prod(f.total() for j, f in enumerate(self._factors) if j != i)
+        return Discrete_Probability._from_arrays(factor.supports[0], factor.dense() * weight)
+
+    def condition(self, axis: int, value) -> "Joint_Probability":
+        """Returns the joint distribution of the other components, given that component ``axis`` equals ``value``."""
+        i, position = self._find(axis)
+        factor = self._factors[i]
+        index = np.flatnonzero(factor.supports[position] == value)
+        sliced = factor.condition(position, index[0]) if len(index) else None
+        if sliced is None or sliced.total() == 0:
+            raise ValueError(f"Component {axis} has probability 0 to be {value}.")
+        factors = self._factors[:i] + self._factors[i + 1:]
+        if sliced.axes:
+            factors.insert(i, sliced.scaled(factor.total() / sliced.total()))
+        mapping = {a: a - (a > axis) for a in range(self.ndim) if a != axis}
+        return Joint_Probability([f.renumbered(mapping) for f in factors])
+
+    def reduce(self, ufunc: np.ufunc, axes: tuple[int, ...] | None = None) -> Discrete_Probability:
+        """
+        Returns the distribution of ``ufunc`` applied over the components ``axes`` (default: all), e.g. ``np.add``.
+        Each factor is reduced on its own, the results are combined by convolution (``np.add``) or outer products.
+        """
+        axes = range(self.ndim) if axes is None else axes
+        selected = [(factor, [i for i, a in enumerate(factor.axes) if a in axes]) for factor in self._factors]
+        weight = prod(factor.total() for factor, positions in selected if not positions)
+        results = []
+        for factor, positions in selected:
+            if positions:
+                keys, probs = factor.points()
+                results.append(Discrete_Probability._from_arrays(reduce(ufunc, [keys[i] for i in positions]), probs * weight))
+                weight = 1.
+        if not results:
+            raise ValueError("No components to reduce.")
+        if ufunc is np.add:
+            return reduce(lambda a, b: a + b, results)
+        return reduce(lambda a, b: _outer(ufunc, a, b), results)
+
+    def sum(self, axes: tuple[int, ...] | None = None) -> Discrete_Probability:
+        """Returns the distribution of the sum of the components ``axes`` (default: all)."""
+        return self.reduce(np.add, axes)
+
+    def max(self, axes: tuple[int, ...] | None = None) -> Discrete_Probability:
+        """Returns the distribution of the maximum of the components ``axes`` (default: all)."""
+        return self.reduce(np.maximum, axes)
+
+    def min(self, axes: tuple[int, ...] | None = None) -> Discrete_Probability:
+        """Returns the distribution of the minimum of the components ``axes`` (default: all)."""
+        return self.reduce(np.minimum, axes)
+
+def _outer(ufunc: np.ufunc, a: Discrete_Probability, b: Discrete_Probability) -> Discrete_Probability:
+    """Returns the distribution of ``ufunc(a, b)`` for independent ``a`` and ``b`` with a vectorized outer product."""
+    (keys_a, probs_a), (keys_b, probs_b) = a._numeric(), b._numeric()
+    return Discrete_Probability._from_arrays(ufunc.outer(keys_a, keys_b).ravel(), np.outer(probs_a, probs_b).ravel())
+
+class Markov_Chain(Generic[T]):
+    """
+    A Markov chain compiled once from a ``transition`` function, mapping each state to the distribution of its successors.
+    All states reachable from ``states`` are indexed and the transitions stored as sparse matrix,
+    so that evolving a distribution is a sparse matrix-vector product per step.
+
+    Parameters
+    ----------
+    transition : f(state) -> Discrete_Probability
+        Distribution of the next state.
+    states : iterable or Discrete_Probability
+        Initial states to explore the reachable states from.
+    """
+
+    def __init__(self, transition: Callable[[T], Discrete_Probability[T]], states):
+        self.states: list[T] = list(states)
+        self.index: dict[T, int] = {state: i for i, state in enumerate(self.states)}
+        rows, cols, data = [], [], []
+        i = 0
+        while i < len(self.states):
+            for state, value in transition(self.states[i]).items():
+                if state not in self.index:
+                    self.index[state] = len(self.states)
+                    self.states.append(state)
+                rows.append(i)
+                cols.append(self.index[state])
+                data.append(value)
+            i += 1
+        n = len(self.states)
+        self.matrix = sparse.csr_matrix((data, (rows, cols)), shape=(n, n))
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def _vector(self, proba: Discrete_Probability[T]) -> np.ndarray:
+        vector = np.zeros(len(self.states))
+        for state, value in proba.items():
+            if state not in self.index:
+                raise ValueError(f"State {state} was not compiled into the Markov chain.")
+            vector[self.index[state]] += value
+        return vector
+
+    def _proba(self, vector: np.ndarray) -> Discrete_Probability[T]:
+        nonzero = np.flatnonzero(vector)
+        return Discrete_Probability(dict(zip([self.states[i] for i in nonzero.tolist()], vector[nonzero].tolist())))
+
+    def evolve(self, proba: Discrete_Probability[T], n: int = 1, method: str = "auto") -> Discrete_Probability[T]:
+        """
+        Returns the distribution after ``n`` steps starting from ``proba``.
 
-dice = Dice(6,20)
+        Parameters
+        ----------
+        method : 'auto', 'iterate', 'power', optional
+            ``iterate`` does ``n`` sparse matrix-vector products,
+            ``power`` computes the ``n``-th matrix power by squaring.
+            ``auto`` uses ``power`` if ``n`` exceeds the number of states.
+            The default is ``auto``.
+        """
+        vector = self._vector(proba)
+        if method == "auto":
+            method = "power" if n > len(self.states) else "iterate"
+        if method == "iterate":
+            transposed = self.matrix.T.tocsr()
+            for _ in range(n):
+                vector = transposed @ vector
+        elif method == "power":
+            power = self.matrix
+            while n:
+                if n & 1:
+                    vector = power.T @ vector
+                n >>= 1
+                if n:
+                    power = power @ power
+                    if sparse.issparse(power) and power.nnz > _DENSE_POWER * len(self.states)**2:
+                        power = power.toarray() # squaring fills the matrix, dense products are faster
+        else:
+            raise ValueError(f"Unknown method {method}.")
+        return self._proba(vector)
 
-def handle(t):
-    t = list(t)
-    t.remove(min(t))
-    t.remove(min(t))
-    t.remove(min(t))
-    return tuple(t)
+    def stationary(self) -> Discrete_Probability[T]:
+        """Returns the stationary distribution, solving ``pi P = pi`` with ``sum(pi) = 1``. The chain should be irreducible."""
+        n = len(self.states)
+        system = (self.matrix.T - sparse.identity(n)).tolil()
+        system[n - 1, :] = np.ones(n)
+        rhs = np.zeros(n)
+        rhs[n - 1] = 1
+        return self._proba(spsolve(system.tocsc(), rhs))
 
-d2 = dice.map(handle)
-d3 = d2.map(sum)
-print(d3)
+if __name__ == "__main__":
+    print(Dice_Keep_Sum(6, 3, 20))
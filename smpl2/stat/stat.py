@@ -1,16 +1,17 @@
 import numpy as np
 from  uncertainties import ufloat
-import uncertainties.unumpy as unp
-from uncertainties.unumpy import nominal_values as unv
-from uncertainties.unumpy import std_devs as usd
+from smpl2.uarray import Uncertain_Array, unv, usd
 import scipy
 import math
 
 def poisson(n):
     """
     Return ``n`` with added poissonian uncertainties.
+
+    Returns an :class:`smpl2.uarray.Uncertain_Array` (a ``unp.uarray`` before), which also works with
+    ``unp.nominal_values``/``unp.std_devs`` and ``.item()``. ``.to_unumpy()`` converts it back to ufloats.
     """
-    return unp.uarray(n, np.sqrt(n + (n==0 + 0)))
+    return Uncertain_Array(n, np.sqrt(n + (n==0 + 0)))
 
 def normalize(data):
     """
@@ -22,15 +23,15 @@ def _wmean(n, w=None):
     """
     Calculates the weighted mean value of ``n``.
     """
-    if w==None: w = usd(n)
-    return sum(w*n) / sum(w)
+    if w is None: w = usd(n)
+    return np.sum(w*n) / np.sum(w)
 
 def weighted_mean(n, w=None, sample=True):
     """
     Return weighted mean of ``n`` with combined error of variance and unvertainties of ``n``.
     """
     assert len(n) > 1
-    if w==None: w = 1/usd(n)**2 # weights of collection
+    if w is None: w = 1/usd(n)**2 # weights of collection
     k = _wmean(n,w)  # weighted mean
     err = _wmean((unv(n) - unv(k))**2, w) # weighted mean square diff
     if sample: err *= 1 / (1 - _wmean(w,w)/sum(w)) # correction for sampling
@@ -0,0 +1,6 @@
+"""
+Fast arrays of values with uncertainties.
+"""
+from .uarray import Uncertain_Array, unv, usd
+
+__all__ = ['Uncertain_Array', 'unv', 'usd']
@@ -0,0 +1,560 @@
+import warnings
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+from scipy import sparse
+import uncertainties as unc
+from uncertainties import unumpy as unp
+
+# first order derivatives of the supported ufuncs with respect to each of their inputs
+_DERIVATIVES = {
+    np.negative: lambda x: (-1.,),
+    np.positive: lambda x: (1.,),
+    np.absolute: lambda x: (np.where(x < 0, -1., 1.),), # as uncertainties, 1 at 0
+    np.exp: lambda x: (np.exp(x),),
+    np.exp2: lambda x: (np.log(2)*np.exp2(x),),
+    np.expm1: lambda x: (np.exp(x),),
+    np.log: lambda x: (1/x,),
+    np.log2: lambda x: (1/(x*np.log(2)),),
+    np.log10: lambda x: (1/(x*np.log(10)),),
+    np.log1p: lambda x: (1/(1 + x),),
+    np.sqrt: lambda x: (0.5/np.sqrt(x),),
+    np.cbrt: lambda x: (1/(3*np.cbrt(x)**2),),
+    np.square: lambda x: (2*x,),
+    np.reciprocal: lambda x: (-1/x**2,),
+    np.sin: lambda x: (np.cos(x),),
+    np.cos: lambda x: (-np.sin(x),),
+    np.tan: lambda x: (1/np.cos(x)**2,),
+    np.arcsin: lambda x: (1/np.sqrt(1 - x**2),),
+    np.arccos: lambda x: (-1/np.sqrt(1 - x**2),),
+    np.arctan: lambda x: (1/(1 + x**2),),
+    np.sinh: lambda x: (np.cosh(x),),
+    np.cosh: lambda x: (np.sinh(x),),
+    np.tanh: lambda x: (1/np.cosh(x)**2,),
+    np.arcsinh: lambda x: (1/np.sqrt(x**2 + 1),),
+    np.arccosh: lambda x: (1/np.sqrt(x**2 - 1),),
+    np.arctanh: lambda x: (1/(1 - x**2),),
+    np.deg2rad: lambda x: (np.pi/180,),
+    np.rad2deg: lambda x: (180/np.pi,),
+    np.add: lambda a, b: (1., 1.),
+    np.subtract: lambda a, b: (1., -1.),
+    np.multiply: lambda a, b: (b, a),
+    np.true_divide: lambda a, b: (1/b, -a/b**2),
+    np.power: lambda a, b: (b*a**(b - 1.), np.log(a)*a**b),
+    np.arctan2: lambda a, b: (b/(a**2 + b**2), -a/(a**2 + b**2)),
+    np.hypot: lambda a, b: (a/np.hypot(a, b), b/np.hypot(a, b)),
+    np.maximum: lambda a, b: (a >= b, a < b),
+    np.minimum: lambda a, b: (a <= b, a > b),
+}
+
+# ufuncs which only depend on the nominal values and return plain arrays
+_NOMINAL = {
+    np.greater, np.greater_equal, np.less, np.less_equal, np.equal, np.not_equal,
+    np.isfinite, np.isinf, np.isnan, np.sign, np.floor, np.ceil, np.rint, np.trunc,
+}
+
+_FUNCTIONS = {}
+
+def _implements(*funcs):
+    """Registers a fast implementation of the numpy functions ``funcs`` for :class:`Uncertain_Array`."""
+    def decorator(impl):
+        for func in funcs:
+            _FUNCTIONS[func] = impl
+        return impl
+    return decorator
+
+class _Source:
+    """
+    Independent standard normal variables, one per element of the array they were created for.
+    Every uncertain value is a linear combination of the variables of its sources.
+    """
+    __slots__ = ('size', '_variables')
+
+    def __init__(self, size):
+        self.size, self._variables = size, None
+
+    def variance(self, index):
+        return 1.
+
+    def variables(self):
+        """Returns the variables as ufloats, created once on demand for conversions to ``unp.uarray``."""
+        if self._variables is None:
+            self._variables = unp.uarray(np.zeros(self.size), np.ones(self.size))
+        return self._variables
+
+class _Reduction:
+    """
+    Linear combinations of the variables of several sources, e.g. sums,
+    with the sparse jacobian ``jac[source]`` of shape ``(size, source.size)``.
+    """
+    __slots__ = ('size', 'jac', '_variance', '_variables')
+
+    def __init__(self, size, jac):
+        self.size, self.jac, self._variance, self._variables = size, jac, None, None
+
+    def variance(self, index):
+        if self._variance is None:
+            self._variance = sum(np.asarray(j.multiply(j).sum(axis=1)).ravel() for j in self.jac.values())
+        return self._variance[index]
+
+    def variables(self):
+        """Returns the combinations as ufloats of the variables of the sources, created once on demand."""
+        if self._variables is None:
+            variables = np.zeros(self.size, dtype=object)
+            for source, jac in self.jac.items():
+                z = source.variables()
+                for m in range(self.size):
+                    row = slice(jac.indptr[m], jac.indptr[m + 1])
+                    variables[m] = variables[m] + np.dot(jac.data[row], z[jac.indices[row]])
+            self._variables = variables
+        return self._variables
+
+def _index(idx, coeff):
+    """Returns the element of the source each position depends on, where ``None`` stands for the identity."""
+    return np.arange(coeff.size).reshape(coeff.shape) if idx is None else idx
+
+def _lookup(matrix, rows, cols):
+    """Returns the entries ``matrix[rows, cols]`` of a sparse matrix elementwise."""
+    rows, cols = np.broadcast_arrays(rows, cols)
+    if rows.size == 0:
+        return np.zeros(rows.shape)
+    return np.asarray(matrix.tocsr()[rows.ravel(), cols.ravel()]).reshape(rows.shape)
+
+def _covariance(atom, idx, other, other_idx):
+    """Returns the covariance of the elements ``idx`` of ``atom`` and ``other_idx`` of ``other``."""
+    if isinstance(atom, _Source) and isinstance(other, _Source):
+        return (idx == other_idx).astype(float) if atom is other else 0.
+    if isinstance(atom, _Source):
+        atom, idx, other, other_idx = other, other_idx, atom, idx
+    if isinstance(other, _Source):
+        return _lookup(atom.jac[other], idx, other_idx) if other in atom.jac else 0.
+    return sum((_lookup(jac @ other.jac[source].T, idx, other_idx) for source, jac in atom.jac.items() if source in other.jac), 0.)
+
+def _std(terms, shape):
+    """Returns the standard deviations from the contributions of the sources, including their covariances."""
+    pairs = [(atom, idx, coeff) for atom, p in terms.items() for idx, coeff in p]
+    if len(pairs) == 1 and isinstance(pairs[0][0], _Source):
+        return np.abs(pairs[0][2])
+    variance = np.zeros(shape)
+    for i, (atom, idx, coeff) in enumerate(pairs):
+        index = _index(idx, coeff)
+        variance = variance + coeff**2*atom.variance(index)
+        for other, other_idx, other_coeff in pairs[:i]:
+            if other is atom or not isinstance(atom, _Source) or not isinstance(other, _Source):
+                variance = variance + 2*coeff*other_coeff*_covariance(atom, index, other, _index(other_idx, other_coeff))
+    return np.sqrt(np.maximum(variance, 0.))
+
+def _add_pair(terms, atom, idx, coeff):
+    """Adds the contribution ``coeff`` of the elements ``idx`` of ``atom``, merged with one of the same elements."""
+    pairs = terms.setdefault(atom, [])
+    for i, (other_idx, other_coeff) in enumerate(pairs):
+        if other_idx is idx or idx is not None and other_idx is not None \
+                and other_idx.shape == idx.shape and np.array_equal(other_idx, idx):
+            pairs[i] = (other_idx, other_coeff + coeff)
+            return
+    pairs.append((idx, coeff))
+
+def _combine(shape, weighted):
+    """Returns the contributions of the sum of ``terms*factor`` over ``weighted``, broadcast to ``shape``."""
+    result = {}
+    for terms, factor in weighted:
+        for atom, pairs in terms.items():
+            for idx, coeff in pairs:
+                scaled = factor*coeff
+                # exact values do not contribute even with undefined derivatives
+                if not np.all(np.isfinite(scaled)):
+                    scaled = np.where(coeff == 0, 0., scaled)
+                if scaled.shape != coeff.shape or scaled.shape != shape:
+                    idx, scaled = np.broadcast_to(_index(idx, coeff), shape), np.broadcast_to(scaled, shape)
+                _add_pair(result, atom, idx, scaled)
+    return result
+
+def _parts(x):
+    """Returns the nominal values and the uncertainty contributions of ``x`` by source."""
+    if isinstance(x, Uncertain_Array):
+        return x.n, x._terms
+    x = np.asarray(x)
+    if x.dtype == object:
+        x = Uncertain_Array.from_unumpy(x)
+        return x.n, x._terms
+    return x, {}
+
+def _is_unumpy(x):
+    """True for ufloats and ``unp.uarray``, whose correlations only the fallback to unumpy keeps."""
+    return isinstance(x, unc.UFloat) or isinstance(x, np.ndarray) and x.dtype == object
+
+def _to_unumpy(x):
+    """Recursively replaces every :class:`Uncertain_Array` in ``x`` with the equivalent ``unp.uarray``."""
+    if isinstance(x, Uncertain_Array):
+        return x.to_unumpy()
+    if isinstance(x, (list, tuple)):
+        return type(x)(_to_unumpy(v) for v in x)
+    if isinstance(x, dict):
+        return {k: _to_unumpy(v) for k, v in x.items()}
+    return x
+
+class Uncertain_Array(NDArrayOperatorsMixin):
+    """
+    Array of values with uncertainties, stored as float64 arrays instead of one ufloat per element.
+
+    Drop-in replacement for ``unp.uarray`` on large datasets.
+    NumPy ufuncs and reductions propagate the uncertainties to first order, keeping the correlations like ``unp.uarray``:
+    every array stores per independent source which element of the source each position depends on and how strongly,
+    so expressions reusing the same data, like ``x**2/(1 + x)`` or ``np.sum(x) - x[0]``, are exact
+    while plain data costs a single array.
+    Scalars are 0-d arrays, which print like ufloats.
+    Operations with ``ufloat`` values, like fit parameters, or without a fast implementation
+    fall back to the per-element ``unp.uarray``.
+
+    Parameters
+    ----------
+    nominal : array_like
+        Nominal values.
+    std : array_like, optional
+        Standard deviations, broadcast to the shape of ``nominal``.
+
+    Examples
+    --------
+    >>> a = Uncertain_Array([1., 4.], [0.1, 0.2])
+    >>> b = np.sqrt(a) * 2
+    >>> b.n, b.s
+    (array([2., 4.]), array([0.1, 0.1]))
+    >>> (a - a).s
+    array([0., 0.])
+    >>> a[1]
+    4.0+/-0.2
+    >>> np.sum(a) - a[0]
+    4.0+/-0.2
+    """
+    def __init__(self, nominal, std=0.):
+        self.n = np.asarray(nominal, dtype=float, order='C')
+        std = np.asarray(std, dtype=float)
+        if std.shape != self.n.shape:
+            std = np.broadcast_to(std, self.n.shape)
+        self._terms = {_Source(self.n.size): [(None, std)]} if np.any(std) else {}
+        self._s = None
+
+    @classmethod
+    def _from_terms(cls, nominal, terms):
+        self = cls.__new__(cls)
+        self.n, self._terms, self._s = np.asarray(nominal, dtype=float), terms, None
+        return self
+
+    @classmethod
+    def from_unumpy(cls, array):
+        """Returns the :class:`Uncertain_Array` of a ``unp.uarray``, dropping correlations to other values."""
+        return cls(unp.nominal_values(array), unp.std_devs(array))
+
+    def to_unumpy(self):
+        """Returns the equivalent ``unp.uarray``, whose ufloats stay correlated with other converted arrays."""
+        result = self.n.astype(object)
+        for atom, pairs in self._terms.items():
+            variables = atom.variables()
+            for idx, coeff in pairs:
+                result = result + coeff*variables[_index(idx, coeff)]
+        return result
+
+    @property
+    def s(self):
+        if self._s is None:
+            self._s = _std(self._terms, self.n.shape)
+        return self._s
+
+    @property
+    def nominal_values(self):
+        return self.n
+
+    @property
+    def std_devs(self):
+        return self.s
+
+    @property
+    def nominal_value(self):
+        return self.n[()]
+
+    @property
+    def std_dev(self):
+        return self.s[()]
+
+    @property
+    def shape(self):
+        return self.n.shape
+
+    @property
+    def ndim(self):
+        return self.n.ndim
+
+    @property
+    def size(self):
+        return self.n.size
+
+    @property
+    def T(self):
+        return self.transpose()
+
+    def __len__(self):
+        return len(self.n)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, key):
+        terms = {atom: [(np.asarray(_index(idx, coeff)[key]), np.asarray(coeff[key])) for idx, coeff in pairs]
+                 for atom, pairs in self._terms.items()}
+        return Uncertain_Array._from_terms(self.n[key], terms)
+
+    def __setitem__(self, key, value):
+        # the assigned elements become a new independent source
+        self.n[key] = unv(value)
+        terms = {}
+        for atom, pairs in self._terms.items():
+            for idx, coeff in pairs:
+                coeff = np.array(coeff)
+                coeff[key] = 0.
+                terms.setdefault(atom, []).append((idx, coeff))
+        s = np.zeros(self.shape)
+        s[key] = usd(value)
+        if np.any(s):
+            terms[_Source(self.size)] = [(None, s)]
+        self._terms, self._s = terms, None
+
+    def _ufloat(self):
+        with warnings.catch_warnings():
+            # exact values are fine for printing
+            warnings.simplefilter('ignore', UserWarning)
+            return unc.ufloat(float(self.n), float(self.s))
+
+    def __repr__(self):
+        if self.ndim == 0:
+            return repr(self._ufloat())
+        return "Uncertain_Array(%s, %s)" % (np.array2string(self.n, separator=', '), np.array2string(self.s, separator=', '))
+
+    def __str__(self):
+        return str(self._ufloat()) if self.ndim == 0 else repr(self)
+
+    def __format__(self, format_spec):
+        return format(self._ufloat(), format_spec) if self.ndim == 0 else super().__format__(format_spec)
+
+    def __float__(self):
+        return float(self.n)
+
+    def __bool__(self):
+        return bool(self.n)
+
+    def item(self, *args):
+        """Returns one element as ufloat, like ``item`` of a ``unp.uarray``."""
+        if len(args) == 1:
+            args = np.unravel_index(args[0], self.shape)
+        elif not args:
+            if self.size != 1:
+                raise ValueError("can only convert an array of size 1 to a Python scalar")
+            args = (0,)*self.ndim
+        value = self[tuple(args)].to_unumpy()
+        return value.item() if isinstance(value, np.ndarray) else value
+
+    def copy(self):
+        return np.copy(self)
+
+    def reshape(self, *shape, order='C'):
+        return np.reshape(self, shape[0] if len(shape) == 1 else shape, order=order)
+
+    def transpose(self, *axes):
+        return np.transpose(self, axes[0] if len(axes) == 1 else axes or None)
+
+    def ravel(self):
+        return np.ravel(self)
+
+    def flatten(self):
+        return np.copy(np.ravel(self))
+
+    def sum(self, axis=None, dtype=None, out=None, keepdims=False):
+        return np.sum(self, axis=axis, dtype=dtype, out=out, keepdims=keepdims)
+
+    def mean(self, axis=None, dtype=None, out=None, keepdims=False):
+        return np.mean(self, axis=axis, dtype=dtype, out=out, keepdims=keepdims)
+
+    def min(self, axis=None, out=None, keepdims=False):
+        return np.min(self, axis=axis, out=out, keepdims=keepdims)
+
+    def max(self, axis=None, out=None, keepdims=False):
+        return np.max(self, axis=axis, out=out, keepdims=keepdims)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.to_unumpy(), dtype=dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != '__call__' or kwargs.get('out') is not None or ufunc not in _DERIVATIVES and ufunc not in _NOMINAL \
+                or any(_is_unumpy(x) for x in inputs):
+            return _fallback(ufunc, method, inputs, kwargs)
+        parts = [_parts(x) for x in inputs]
+        nominal = [n for n, terms in parts]
+        if ufunc in _NOMINAL:
+            return ufunc(*nominal, **kwargs)
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            value = ufunc(*nominal, **kwargs)
+            derivatives = _DERIVATIVES[ufunc](*nominal)
+            # chain rule per source
+            terms = _combine(np.shape(value), [(terms, d) for (n, terms), d in zip(parts, derivatives)])
+        return Uncertain_Array._from_terms(value, terms)
+
+    def __array_function__(self, func, types, args, kwargs):
+        if func in _FUNCTIONS:
+            result = _FUNCTIONS[func](*args, **kwargs)
+            if result is not NotImplemented:
+                return result
+        return func(*_to_unumpy(args), **_to_unumpy(kwargs))
+
+def _fallback(ufunc, method, inputs, kwargs):
+    """Evaluates ``ufunc`` on ``unp.uarray`` operands, with the matching unumpy function if there is one."""
+    inputs = _to_unumpy(inputs)
+    if method == '__call__' and ufunc.__name__ in unp.__all__:
+        return getattr(unp, ufunc.__name__)(*inputs, **kwargs)
+    return getattr(ufunc, method)(*inputs, **kwargs)
+
+def _as_uarray(x):
+    return x if isinstance(x, Uncertain_Array) else Uncertain_Array._from_terms(*_parts(x))
+
+def _reshaped(a, reshape, keeps_order=False):
+    """
+    Applies ``reshape`` to the nominal values and every contribution of ``a``, keeping the correlations.
+    ``keeps_order`` if the elements stay in the same flat order, so identical contributions stay identical.
+    """
+    terms = {atom: [(None if keeps_order and idx is None else reshape(_index(idx, coeff)), reshape(coeff)) for idx, coeff in pairs]
+             for atom, pairs in a._terms.items()}
+    return Uncertain_Array._from_terms(reshape(a.n), terms)
+
+@_implements(np.shape)
+def _shape(a):
+    return a.shape
+
+@_implements(np.ndim)
+def _ndim(a):
+    return a.ndim
+
+@_implements(np.size)
+def _size(a, axis=None):
+    return np.size(a.n, axis)
+
+def _reduction(mean):
+    """Returns the sum or the mean along ``axis`` as combination of the sources, which keeps it correlated with them."""
+    def reduction(a, axis=None, dtype=None, out=None, keepdims=False):
+        if out is not None or dtype is not None and np.dtype(dtype).kind != 'f':
+            return NotImplemented
+        a = _as_uarray(a)
+        kept = np.sum(a.n, axis=axis, keepdims=True)
+        scale = kept.size/a.size if mean and a.size else 1.
+        n = np.sum(a.n, axis=axis, keepdims=keepdims)*scale
+        # the position in the result of every element of a
+        rows = np.broadcast_to(np.arange(kept.size).reshape(kept.shape), a.shape).ravel()
+        jac = {}
+        for atom, pairs in a._terms.items():
+            for idx, coeff in pairs:
+                m = sparse.csr_matrix((np.ravel(coeff)*scale, (rows, _index(idx, coeff).ravel())), shape=(kept.size, atom.size))
+                for source, j in (atom.jac.items() if isinstance(atom, _Reduction) else [(atom, None)]):
+                    part = m if j is None else m @ j
+                    jac[source] = jac[source] + part if source in jac else part
+        if not jac:
+            return Uncertain_Array._from_terms(n, {})
+        return Uncertain_Array._from_terms(n, {_Reduction(kept.size, jac): [(None, np.ones(np.shape(n)))]})
+    return reduction
+
+_implements(np.sum)(_reduction(mean=False))
+_implements(np.mean)(_reduction(mean=True))
+
+def _extreme(arg):
+    """Returns the uncertain elements with the extreme nominal values along ``axis``."""
+    def extreme(a, axis=None, out=None, keepdims=False):
+        if out is not None:
+            return NotImplemented
+        if axis is None:
+            result = a[np.unravel_index(arg(a.n), a.shape)]
+            return np.reshape(result, (1,)*a.ndim) if keepdims else result
+        i = np.expand_dims(arg(a.n, axis=axis), axis)
+        result = _reshaped(a, lambda x: np.take_along_axis(x, i, axis))
+        return result if keepdims else _reshaped(result, lambda x: x.squeeze(axis), keeps_order=True)
+    return extreme
+
+_implements(np.min, np.amin)(_extreme(np.argmin))
+_implements(np.max, np.amax)(_extreme(np.argmax))
+
+@_implements(np.where)
+def _where(condition, x=None, y=None):
+    condition = np.asarray(unv(condition), dtype=bool)
+    if x is None and y is None:
+        return np.where(condition)
+    if _is_unumpy(x) or _is_unumpy(y):
+        return NotImplemented
+    (xn, xt), (yn, yt) = _parts(x), _parts(y)
+    n = np.where(condition, xn, yn)
+    return Uncertain_Array._from_terms(n, _combine(n.shape, [(xt, condition), (yt, ~condition)]))
+
+@_implements(np.concatenate)
+def _concatenate(arrays, axis=0, out=None, dtype=None, casting='same_kind'):
+    if out is not None or any(_is_unumpy(a) for a in arrays):
+        return NotImplemented
+    arrays = [_as_uarray(a) for a in arrays]
+    if axis is None:
+        arrays, axis = [np.ravel(a) for a in arrays], 0
+    terms = {}
+    for atom in dict.fromkeys(atom for a in arrays for atom in a._terms):
+        # arrays without the source contribute zeros
+        for slot in range(max(len(a._terms.get(atom, ())) for a in arrays)):
+            pairs = [a._terms[atom][slot] if slot < len(a._terms.get(atom, ())) else (np.zeros(a.shape, dtype=int), np.zeros(a.shape))
+                     for a in arrays]
+            terms.setdefault(atom, []).append((np.concatenate([_index(idx, coeff) for idx, coeff in pairs], axis),
+                                               np.concatenate([coeff for idx, coeff in pairs], axis)))
+    return Uncertain_Array._from_terms(np.concatenate([a.n for a in arrays], axis), terms)
+
+@_implements(np.reshape)
+def _reshape(a, *args, **kwargs):
+    order = kwargs.get('order', args[1] if len(args) > 1 else 'C')
+    return _reshaped(a, lambda x: np.reshape(x, *args, **kwargs), keeps_order=order == 'C')
+
+@_implements(np.ravel)
+def _ravel(a, order='C'):
+    return _reshaped(a, lambda x: np.ravel(x, order), keeps_order=order == 'C')
+
+@_implements(np.transpose)
+def _transpose(a, axes=None):
+    return _reshaped(a, lambda x: np.transpose(x, axes))
+
+@_implements(np.atleast_1d)
+def _atleast_1d(a):
+    return _reshaped(a, np.atleast_1d, keeps_order=True)
+
+@_implements(np.atleast_2d)
+def _atleast_2d(a):
+    return _reshaped(a, np.atleast_2d, keeps_order=True)
+
+@_implements(np.copy)
+def _copy(a, order='K', subok=False):
+    # contributions are never modified in place, only the nominal values need a copy
+    return Uncertain_Array._from_terms(a.n.copy(), {atom: list(pairs) for atom, pairs in a._terms.items()})
+
+def unv(x):
+    """
+    Returns the nominal values of ``x``.
+    Fast for :class:`Uncertain_Array` and plain numbers, falls back to ``unp.nominal_values`` for ufloats.
+    """
+    if isinstance(x, Uncertain_Array):
+        return x.n
+    if isinstance(x, unc.UFloat):
+        return x.n
+    a = np.asarray(x)
+    return unp.nominal_values(a) if a.dtype == object else a
+
+def usd(x):
+    """
+    Returns the standard deviations of ``x``.
+    Fast for :class:`Uncertain_Array` and plain numbers, falls back to ``unp.std_devs`` for ufloats.
+    """
+    if isinstance(x, Uncertain_Array):
+        return x.s
+    if isinstance(x, unc.UFloat):
+        return x.s
+    a = np.asarray(x)
+    return unp.std_devs(a) if a.dtype == object else np.zeros(a.shape)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -1,7 +1,8 @@
+import functools
+import inspect
 import numpy as np
 from smpl2.latex import latexify
-from uncertainties.unumpy import nominal_values as unv
-from uncertainties.unumpy import std_devs as usd
+from smpl2.uarray import unv, usd
 
 def get(key,dic,default):
     """
@@ -41,28 +42,61 @@ def uncertain(array, mode='all'):
     if mode == 'all': return not any(usd(array) == 0)
     return not all(usd(array) == 0)
 
-def reduce_function(f, **kwargs):
+@functools.lru_cache(maxsize=256)
+def _signature(f, fixed=frozenset()):
     """
-    Returns the same function, but without the fixed arguments in ``kwargs``.
+    Returns the free parameter names and the signature of ``f`` without the parameters named in ``fixed``.
+    Cached, so every (function, fixed names) pair is inspected only once.
     """
-    args = [(a, kwargs[a] if a in kwargs else a) for a in f.__code__.co_varnames]
-    newvar = [a for a,v in args if v is a]
-    oldvar = ["%s=%s" % (a,v) for a,v in args]
-    return eval("lambda {newvars}: f({oldvars})".format(newvars=','.join(newvar), oldvars=','.join(oldvar)))
+    signature = inspect.signature(f)
+    params = [p for p in signature.parameters.values() if p.name not in fixed]
+    return tuple(p.name for p in params), signature.replace(parameters=params)
+
+@functools.lru_cache(maxsize=256)
+def _reduce_function(f, fixed):
+    free, signature = _signature(f, frozenset(a for a, t, v in fixed))
+    fixed = {a: v for a, t, v in fixed}
+    def reduced(*args, **kwargs):
+        if kwargs: # bind like the signature, positional only is the fast path of the fits
+            return f(**signature.bind(*args, **kwargs).arguments, **fixed)
+        return f(**dict(zip(free, args)), **fixed)
+    reduced.__signature__ = signature
+    return reduced
+
+def reduce_function(f, /, **kwargs):
+    """
+    Returns the same function, but without the fixed arguments in ``kwargs``.
+    The wrapper is cached for hashable fixed values (and their types, as ``1 == 1.0 == True``),
+    so repeated calls return the same function.
+    """
+    free, signature = _signature(f, frozenset(kwargs))
+    fixed = tuple((a, type(kwargs[a]), kwargs[a]) for a in _signature(f)[0] if a not in free)
+    if not fixed:
+        return f
+    try:
+        return _reduce_function(f, fixed)
+    except TypeError: # unhashable fixed values like arrays
+        return _reduce_function.__wrapped__(f, fixed)
 
+@functools.lru_cache(maxsize=256)
 def unv_lambda(f):
     """
     Returns a function which applies :func:`unv` on the result of ``f``
     """
-    var = ','.join(f.__code__.co_varnames)
-    return eval("lambda {var}: unv(f(var))".format(var=var))
+    def nominal(*args, **kwargs):
+        return unv(f(*args, **kwargs))
+    nominal.__signature__ = _signature(f)[1]
+    return nominal
 
+@functools.lru_cache(maxsize=256)
 def usd_lambda(f):
     """
     Returns a function which applies :func:`usd` on the result of ``f``
     """
-    var = ','.join(f.__code__.co_varnames)
-    return eval("lambda {var}: usd(f({var}))".format(var=var))
+    def std(*args, **kwargs):
+        return usd(f(*args, **kwargs))
+    std.__signature__ = _signature(f)[1]
+    return std
 
 def get_func_description(function, pfit=None, units=None):
     """
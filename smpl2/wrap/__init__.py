@@ -1,6 +1,6 @@
 """
 Simplified wrapping 
 """
-from .wrap import get_varnames,get_lambda,str_get_expr
+from .wrap import get_varnames,get_lambda,str_get_expr,get_jacobian,is_linear
 
-__all__ = ['get_varnames','get_lambda','str_get_expr']
\ No newline at end of file
+__all__ = ['get_varnames','get_lambda','str_get_expr','get_jacobian','is_linear']
\ No newline at end of file
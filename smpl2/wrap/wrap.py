@@ -3,6 +3,9 @@ from sympy.parsing.sympy_parser import parse_expr
 import sympy
 from sympy.printing.pycode import pycode
 import uncertainties.unumpy as unp
+import functools
+import inspect
+import types
 
 import numpy as np
 
@@ -72,4 +75,122 @@ def str_get_expr(expr):
         transformations=(standard_transformations + (implicit_multiplication_application,)),
         evaluate=False
     )
-    return parsed_expr
\ No newline at end of file
+    return parsed_expr
+
+# numpy names whose sympy function is named differently
+_SYMPY_NAMES = {
+    'arcsin': 'asin', 'arccos': 'acos', 'arctan': 'atan', 'arctan2': 'atan2',
+    'arcsinh': 'asinh', 'arccosh': 'acosh', 'arctanh': 'atanh',
+    'absolute': 'Abs', 'abs': 'Abs', 'power': 'Pow', 'ceil': 'ceiling', 'e': 'E',
+}
+
+class _Sympy_Numpy:
+    """Stand-in for the numpy module, which resolves the functions and constants to their sympy counterparts."""
+    def __getattr__(self, name):
+        return getattr(sympy, _SYMPY_NAMES.get(name, name), None) or getattr(np, name)
+
+def _sympy_function(func):
+    """
+    Returns a copy of ``func`` which uses sympy instead of numpy, i.e. ``np.exp`` or a global ``exp`` imported from numpy,
+    or None if ``func`` is no plain python function.
+    """
+    if not isinstance(func, types.FunctionType):
+        return None
+    shim = _Sympy_Numpy()
+    namespace = dict(func.__globals__)
+    for name, value in func.__globals__.items():
+        if value is np:
+            namespace[name] = shim
+        elif isinstance(value, np.ufunc) or getattr(value, '__module__', None) == 'numpy' and callable(value):
+            namespace[name] = getattr(shim, value.__name__)
+    return types.FunctionType(func.__code__, namespace, func.__name__, func.__defaults__, func.__closure__)
+
+class _Structural:
+    """
+    Cache key of a function by its code, defaults, globals and closure values instead of its identity,
+    so functions rebuilt on every call, like ``polN(3)``, share their sympy derivations.
+    """
+    __slots__ = ('func', 'key')
+
+    def __init__(self, func):
+        self.func, self.key = func, func
+        if isinstance(func, types.FunctionType):
+            try:
+                key = (func.__code__, func.__defaults__, tuple(sorted((func.__kwdefaults__ or {}).items())), id(func.__globals__),
+                       tuple((type(c.cell_contents), c.cell_contents) for c in func.__closure__ or ()),
+                       func.__dict__.get('__signature__'))
+                hash(key)
+            except (TypeError, ValueError): # unhashable or empty closure values
+                return
+            self.key = key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        return isinstance(other, _Structural) and self.key == other.key
+
+@functools.lru_cache(maxsize=128)
+def _symbolic(key):
+    """
+    Returns the sympy symbols of the parameters of ``key.func`` and its expression, or None if it can not take symbols.
+    Functions which call numpy directly are retried with the numpy functions translated to sympy.
+    """
+    func = key.func
+    symbols = sympy.symbols(list(inspect.signature(func).parameters), real=True)
+    for f in (func, _sympy_function(func)):
+        if f is None:
+            continue
+        try:
+            return symbols, sympy.sympify(f(*symbols))
+        except (TypeError, ValueError, AttributeError, NameError, sympy.SympifyError):
+            pass
+    return None
+
+def get_jacobian(func):
+    """
+    Returns the analytic jacobian ``(jac, jac_x)`` of ``func(x, *params)`` derived once via sympy,
+    or None if ``func`` can not be evaluated with sympy symbols.
+    Functions with the same code, defaults and closure values share one derivation.
+
+    ``jac(x, *params)`` has the shape of ``x`` plus a last axis over ``params``,
+    ``jac_x(x, *params)`` is the derivative in ``x`` with the shape of ``x``.
+    """
+    return _jacobian(_Structural(func))
+
+@functools.lru_cache(maxsize=128)
+def _jacobian(key):
+    symbolic = _symbolic(key)
+    if symbolic is None:
+        return None
+    symbols, expr = symbolic
+    try:
+        grads = [sympy.lambdify(symbols, expr.diff(s), 'numpy') for s in symbols]
+    except (TypeError, ValueError):
+        return None
+
+    def evaluate(grad, x, params):
+        return np.broadcast_to(grad(x, *params), np.broadcast(x, *params).shape)
+
+    def jac(x, *params):
+        return np.stack([evaluate(g, x, params) for g in grads[1:]], axis=-1)
+
+    def jac_x(x, *params):
+        return evaluate(grads[0], x, params)
+
+    return jac, jac_x
+
+def is_linear(func, *params):
+    """
+    True, if ``func(x, *params)`` is linear in the parameters named ``params`` (default: all but ``x``) via sympy.
+    """
+    return _is_linear(_Structural(func), params)
+
+@functools.lru_cache(maxsize=128)
+def _is_linear(key, params):
+    symbolic = _symbolic(key)
+    if symbolic is None:
+        return False
+    symbols, expr = symbolic
+    symbols = [s for s in symbols[1:] if not params or s.name in params]
+    return all(expr.diff(a, b) == 0 for a in symbols for b in symbols)